@@ -0,0 +1,101 @@
+"""Admission of clipboard lookups: debouncing, superseding and a cap on the
+number of lookups running at the same time."""
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock, Timer
+import logging
+log = logging.getLogger("clipster")
+
+
+class Lookup():
+    """One clipboard content waiting for, or going through, a lookup."""
+
+    def __init__(self, admission, lookup_id, text):
+        self._admission = admission
+        self.id = lookup_id
+        self.text = text
+
+    @property
+    def superseded(self):
+        """True once newer clipboard content came in. The lookup should then
+        stop as soon as possible and not report anything."""
+        return self.id != self._admission.latest
+
+
+class Admission():
+    """Calls run(lookup) in a background thread for the latest clipboard
+    content, once no newer content came in for `debounce` seconds.
+    Content replaced during that window is never looked up, content replaced
+    during its lookup is marked as superseded. At most `max_in_flight`
+    lookups run at once; the latest waiting one goes next."""
+
+    def __init__(self, run, debounce=0.15, max_in_flight=2):
+        self._run = run
+        self.debounce = debounce
+        self.max_in_flight = max(1, max_in_flight)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_in_flight, thread_name_prefix="clipfdb-lookup")
+        self._lock = Lock()
+        self._timer = None
+        # Latest lookup not started yet
+        self._pending = None
+        self._in_flight = 0
+        # Id of the latest clipboard content received
+        self.latest = 0
+        self.admitted = 0
+        self.dropped = 0
+
+    def submit(self, text):
+        """Take new clipboard content. Return immediately."""
+        with self._lock:
+            self.latest += 1
+            if self._pending is not None:
+                self.dropped += 1
+            self._pending = Lookup(self, self.latest, text)
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self.debounce > 0:
+                self._timer = Timer(self.debounce, self._admit)
+                self._timer.daemon = True
+                self._timer.start()
+                return
+        self._admit()
+
+    def _admit(self):
+        with self._lock:
+            self._timer = None
+            if self._pending is None or self._in_flight >= self.max_in_flight:
+                # Started when a running lookup is done
+                return
+            lookup, self._pending = self._pending, None
+            self._in_flight += 1
+            self.admitted += 1
+        future = self._executor.submit(self._run, lookup)
+        future.add_done_callback(self._done)
+
+    def _done(self, future):
+        with self._lock:
+            self._in_flight -= 1
+        if not future.cancelled() and (e := future.exception()) is not None:
+            print(f"Error during lookup: {e}")
+            log.debug("Lookup failed", exc_info=e)
+        with self._lock:
+            waiting = self._pending is not None and self._timer is None
+        if waiting:
+            self._admit()
+
+    def shutdown(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._pending = None
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "received": self.latest,
+                "admitted": self.admitted,
+                "dropped": self.dropped,
+                "in_flight": self._in_flight,
+            }
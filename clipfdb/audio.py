@@ -0,0 +1,120 @@
+"""Sound playback through simpleaudio from a thread of its own, with sounds
+decoded once at startup."""
+from collections import deque
+from queue import Queue, Empty
+from threading import Thread
+from time import monotonic, sleep
+import wave
+
+# What to do with a sound triggered while another one is playing
+POLICIES = ("interrupt", "mix", "drop")
+
+
+class Sound():
+    """PCM data of a WAV file, ready to be handed to the audio device."""
+
+    def __init__(self, filepath):
+        with wave.open(filepath, "rb") as w:
+            self.num_channels = w.getnchannels()
+            self.bytes_per_sample = w.getsampwidth()
+            self.sample_rate = w.getframerate()
+            self.audio_data = w.readframes(w.getnframes())
+        self.filepath = filepath
+        self.duration = len(self.audio_data) / max(
+            1, self.num_channels * self.bytes_per_sample * self.sample_rate)
+
+
+class AudioEngine():
+    """Plays Sounds without blocking the caller. Sounds triggered while
+    another one plays either interrupt it, are mixed with it by the sound
+    server, or are dropped, depending on policy."""
+    # Latencies kept to compute percentiles
+    history = 256
+
+    def __init__(self, policy="interrupt"):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown sound policy \"{policy}\"")
+        self.policy = policy
+        self.played = 0
+        self.dropped = 0
+        self.interrupted = 0
+        self.failed = 0
+        # Seconds from play() to the audio device accepting the sound
+        self.latencies = deque(maxlen=self.history)
+        self._playing = []
+        self._queue = Queue()
+        self._thread = Thread(target=self._run, name="clipfdb-audio", daemon=True)
+        self._thread.start()
+
+    def play(self, sound):
+        """Queue sound, return immediately."""
+        self._queue.put((sound, monotonic()))
+
+    def _run(self):
+        import simpleaudio
+        while True:
+            request = self._queue.get()
+            if request is None:
+                break
+            # Unless mixing, only the latest of sounds triggered at once is
+            # worth playing
+            while self.policy != "mix":
+                try:
+                    newer = self._queue.get_nowait()
+                except Empty:
+                    break
+                if newer is None:
+                    self._queue.put(None)
+                    break
+                self.dropped += 1
+                request = newer
+            self._start(simpleaudio, *request)
+
+    def _start(self, simpleaudio, sound, triggered):
+        self._playing = [p for p in self._playing if p.is_playing()]
+        if self._playing:
+            if self.policy == "drop":
+                self.dropped += 1
+                return
+            if self.policy == "interrupt":
+                for play_obj in self._playing:
+                    play_obj.stop()
+                self.interrupted += len(self._playing)
+                self._playing = []
+        try:
+            self._playing.append(simpleaudio.play_buffer(
+                sound.audio_data, sound.num_channels,
+                sound.bytes_per_sample, sound.sample_rate))
+        except Exception as e:
+            self.failed += 1
+            print(f"Error playing {sound.filepath}: {e}")
+            return
+        self.played += 1
+        self.latencies.append(monotonic() - triggered)
+
+    def close(self, timeout=3):
+        """Let queued and playing sounds finish, for up to timeout seconds."""
+        self._queue.put(None)
+        self._thread.join(timeout)
+        deadline = monotonic() + timeout
+        for play_obj in self._playing:
+            while play_obj.is_playing() and monotonic() < deadline:
+                sleep(0.05)
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 2)
+
+        return {
+            "played": self.played,
+            "dropped": self.dropped,
+            "interrupted": self.interrupted,
+            "failed": self.failed,
+            "latency_p50_ms": percentile(0.5),
+            "latency_p95_ms": percentile(0.95),
+            "latency_max_ms": percentile(1),
+        }
@@ -0,0 +1,169 @@
+"""Bloom filter summaries of the file names of a database, telling which
+queries certainly have no match in it.
+
+The filter holds every GRAM byte long substring of the uppercased, utf-8
+encoded names. A query can only match if all of its own substrings of that
+length are in the filter, so a query of TYPICAL_QUERY characters matching
+nothing is a false positive with the rate of one substring to the power of
+its number of substrings. The filter is sized for that rate to be the one
+wanted: from the number of distinct substrings n and the rate p wanted for
+one of them, it has m = -n ln p / ln²2 bits and k = m / n ln 2 hash
+functions.
+"""
+from math import log, ceil
+from os import path, replace, makedirs, getpid
+from zlib import crc32
+import struct
+
+MAGIC = b"CLIPBLM\0"
+VERSION = 2
+GRAM = 5
+# magic, version, gram length, filepath length, hash count, db size,
+# db mtime_ns, name count, bit count, false positive rate it was sized for
+HEADER = struct.Struct("=8sIIIIqqqqd")
+# Query length false positive rates are given for
+TYPICAL_QUERY = 12
+# Starting value of crc32 for the second hash, see positions()
+SEED = 0x9E3779B9
+
+
+def gram_rate(fp_rate, length=TYPICAL_QUERY):
+    """False positive rate of one substring giving fp_rate for a query of
+    that length."""
+    return fp_rate ** (1 / max(1, length - GRAM + 1))
+
+
+def optimal_size(distinct, rate):
+    """(bit count, hash count) for distinct substrings at that rate each.
+    Bits are rounded up to a power of two, see BloomSummary.fold()."""
+    rate = min(max(rate, 1e-12), 0.999)
+    nbits = ceil(-max(distinct, 1) * log(rate) / log(2) ** 2)
+    nbits = 1 << max(6, (nbits - 1).bit_length())
+    return nbits, max(1, round(nbits / max(distinct, 1) * log(2)))
+
+
+class BloomSummary():
+
+    def __init__(self, nbits, hashes=1, names=0, signature=(0, 0), bits=None,
+                 fp_rate=0.0):
+        self.nbits = max(8, nbits - nbits % 8)
+        self.hashes = max(1, hashes)
+        self.bits = bits if bits is not None else bytearray(self.nbits // 8)
+        self.names = names
+        self.signature = signature
+        # Rate wanted when it was built
+        self.fp_rate = fp_rate
+
+    @classmethod
+    def build(cls, encoded_names, fp_rate):
+        """Summary of uppercased, utf-8 encoded names, given as a list, giving
+        fp_rate false positives for TYPICAL_QUERY long queries.
+
+        Names are first added with a single hash function to more bits than
+        they have substrings: how full that filter gets tells how many of
+        them are distinct. With a single hash function needed, it is folded
+        to the right size, otherwise names are added again to a new one."""
+        grams = sum(max(0, len(name) - GRAM + 1) for name in encoded_names)
+        summary = cls(1 << max(6, grams.bit_length()), fp_rate=fp_rate)
+        for name in encoded_names:
+            summary.add(name)
+        nbits, hashes = optimal_size(summary.distinct(), gram_rate(fp_rate))
+        if hashes == 1 and nbits <= summary.nbits:
+            summary.fold(nbits)
+            return summary
+        summary = cls(nbits, hashes, fp_rate=fp_rate)
+        for name in encoded_names:
+            summary.add(name)
+        return summary
+
+    def positions(self, gram):
+        """Bits of gram, by double hashing."""
+        h = crc32(gram)
+        if self.hashes == 1:
+            return (h % self.nbits,)
+        step = crc32(gram, SEED) | 1
+        return [(h + i * step) % self.nbits for i in range(self.hashes)]
+
+    def add(self, encoded_name):
+        bits = self.bits
+        for i in range(len(encoded_name) - GRAM + 1):
+            for h in self.positions(encoded_name[i:i + GRAM]):
+                bits[h >> 3] |= 1 << (h & 7)
+        self.names += 1
+
+    def may_contain(self, query_str):
+        """False if no name contains query_str (case insensitive)."""
+        needle = query_str.upper().encode("utf-8", errors="replace")
+        bits = self.bits
+        for i in range(len(needle) - GRAM + 1):
+            for h in self.positions(needle[i:i + GRAM]):
+                if not bits[h >> 3] & (1 << (h & 7)):
+                    return False
+        return True
+
+    def distinct(self):
+        """Estimate of the number of distinct substrings added."""
+        fill = min(self.fill_ratio(), 1 - 1 / self.nbits)
+        return -self.nbits / self.hashes * log(1 - fill)
+
+    def fold(self, nbits):
+        """Shrink to nbits, which must divide the current bit count. Only
+        valid with a single hash function: h % nbits is (h % self.nbits) %
+        nbits, so each bit is the union of the bits it stands for."""
+        size = nbits // 8
+        folded = 0
+        for start in range(0, len(self.bits), size):
+            folded |= int.from_bytes(self.bits[start:start + size], "little")
+        self.bits = bytearray(folded.to_bytes(size, "little"))
+        self.nbits = nbits
+
+    def fill_ratio(self):
+        return sum(bin(b).count("1") for b in self.bits) / self.nbits
+
+    def false_positive_rate(self, length=TYPICAL_QUERY, fill=None):
+        """Estimated chance for a query of that length, whose substrings are
+        in no name, not to be ruled out."""
+        if fill is None:
+            fill = self.fill_ratio()
+        return (fill ** self.hashes) ** max(0, length - GRAM + 1)
+
+    def report(self):
+        """One line summary of memory used and expected false positives."""
+        fill = self.fill_ratio()
+        size = len(self.bits)
+        return (f"{size / 1024:.0f} KiB ({size / 1024 / max(self.names, 1) * 1e6:.0f} KiB"
+                f" per million names), {self.hashes} hash function"
+                f"{'s' if self.hashes > 1 else ''}, {fill:.0%} full, "
+                f"{self.false_positive_rate(fill=fill) * 100:.2g}% false positives for "
+                f"{TYPICAL_QUERY} character queries ({self.fp_rate * 100:.2g}% wanted)")
+
+    def save(self, filepath, db_filepath):
+        """Write the summary, replacing any previous one atomically."""
+        encoded_path = db_filepath.encode("utf-8")
+        header = HEADER.pack(MAGIC, VERSION, GRAM, len(encoded_path), self.hashes,
+                             self.signature[0], self.signature[1],
+                             self.names, self.nbits, self.fp_rate)
+        makedirs(path.dirname(filepath), exist_ok=True)
+        tmp_path = f"{filepath}.{getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(header + encoded_path)
+            f.write(self.bits)
+        replace(tmp_path, filepath)
+
+    @classmethod
+    def load(cls, filepath, db_filepath, signature, fp_rate):
+        """Return the summary saved for db_filepath in that state, sized for
+        fp_rate, or None."""
+        try:
+            with open(filepath, "rb") as f:
+                magic, version, gram, path_len, hashes, db_size, db_mtime, names, \
+                    nbits, saved_rate = HEADER.unpack(f.read(HEADER.size))
+                saved_path = f.read(path_len).decode("utf-8", errors="replace")
+                bits = bytearray(f.read())
+        except (OSError, struct.error):
+            return None
+        if magic != MAGIC or version != VERSION or gram != GRAM \
+        or saved_path != db_filepath or (db_size, db_mtime) != signature \
+        or len(bits) != nbits // 8 or saved_rate != fp_rate:
+            return None
+        return cls(nbits, hashes, names, signature, bits, saved_rate)
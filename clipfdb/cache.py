@@ -0,0 +1,117 @@
+"""Bounded cache of query results, per database."""
+from collections import OrderedDict
+from sys import getsizeof
+from threading import Lock
+from time import monotonic
+
+# Rough per-row overhead besides the strings themselves
+ROW_OVERHEAD = 100
+
+
+def result_size(result_list):
+    """Approximate memory used by a result list, in bytes."""
+    size = getsizeof(result_list)
+    for item in result_list:
+        size += ROW_OVERHEAD + sum(getsizeof(field) for field in item)
+    return size
+
+
+class QueryCache():
+    """LRU cache of (result_list, found_count) with a time to live, bounded
+    both in number of entries and in bytes. Empty results are cached too.
+
+    Keys are (db_filepath, normalized query_str, max_results,
+    parent_directories). Each database has a generation number, bumped by
+    FDB when its file changed: entries from older generations are dropped."""
+
+    def __init__(self, max_entries=256, max_bytes=4 * 1024 * 1024, ttl=600):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expiry, size, value)
+        self._generations = {}  # db_filepath -> generation
+        self._lock = Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(db_filepath, query_str, max_results, parent_directories):
+        # Queries are case insensitive, but spaces around them are searched
+        # for: normalized the same way as FDB.make_select()
+        return (db_filepath, query_str.upper(), max_results, parent_directories)
+
+    def _check_generation(self, db_filepath, generation):
+        if self._generations.get(db_filepath, generation) != generation:
+            self._drop_db(db_filepath)
+        self._generations[db_filepath] = generation
+
+    def _drop_db(self, db_filepath):
+        for key in [k for k in self._entries if k[0] == db_filepath]:
+            self._remove(key)
+            self.invalidations += 1
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self.bytes -= size
+
+    def get(self, key, generation):
+        """Return a copy of the cached (result_list, found_count), or None."""
+        if self.max_entries <= 0:
+            return None
+        with self._lock:
+            self._check_generation(key[0], generation)
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < monotonic():
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        result_list, found_count = entry[2]
+        return [list(item) for item in result_list], found_count
+
+    def put(self, key, generation, value):
+        """Store (result_list, found_count) for key."""
+        if self.max_entries <= 0:
+            return
+        result_list, found_count = value
+        result_list = tuple(tuple(item) for item in result_list)
+        size = result_size(result_list)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._check_generation(key[0], generation)
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (monotonic() + self.ttl, size, (result_list, found_count))
+            self.bytes += size
+            while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        """Counters to help tune the cache size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
@@ -3,63 +3,87 @@ from os import environ, path, sep
 from typing import List
 import re
 from pathlib import Path
-from subprocess import run
-from operator import itemgetter
+from subprocess import run, PIPE
+from itertools import islice, count
+from collections import OrderedDict
+from threading import Thread, Event, Lock
+from contextlib import contextmanager
 from locale import setlocale, strxfrm, LC_ALL
 from argparse import BooleanOptionalAction, ArgumentParser
 from configparser import ConfigParser
 # from ast import literal_eval
 from urllib import parse
+from time import monotonic, perf_counter
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from importlib.util import find_spec
 import asyncio
 import logging
 log = logging.getLogger("clipster")
 # log.setLevel(logging.DEBUG)
 
-import fdb
-import desktop_notify
+# fdb, desktop_notify and simpleaudio are slow to import, they are only
+# imported once actually used.
 
 from .constants import BColors
+from .scan import ScanIndex
+from .index import Catalog, TrigramIndex, DirectoryTree, file_signature
+from .snapshot import Snapshot, write_snapshot, restamp, SEPARATOR
+from .bloom import BloomSummary
+from .ranking import rank, merge
+from .spawner import Spawner
+from .audio import AudioEngine, Sound
+from .cache import QueryCache
+from .admission import Admission
+from .stats import LatencyStats, ALL
+from .recorder import ClipboardRecorder
+from .profiling import Profiler
+from .slowlog import SlowQueryLog
 
 
 # Notify2 is deprecated and now broken due to changes in the dbus module API.
-LIB_AVAIL = False
-try:
-    import desktop_notify
-    from dbus_next import Variant
-    LIB_AVAIL = True
-except ImportError as e:
-    log.warning(f"Failed to load library: {e}")
-    LIB_AVAIL = False
-
-try:
-    import simpleaudio
-    SA_AVAIL = True
-except ImportError:
-    SA_AVAIL = False
-
-
-def do_async(coro):
-    """
-    Spawn a temporary asyncio loop to run the given coroutine, then close it.
-    """
-    try:
-        loop = asyncio.get_event_loop()
-    except RuntimeError:
-        loop = asyncio.new_event_loop()
-    ret = loop.run_until_complete(coro)
-    loop.run_until_complete(loop.shutdown_asyncgens())
-    return ret
+LIB_AVAIL = find_spec("desktop_notify") is not None \
+    and find_spec("dbus_next") is not None
+if not LIB_AVAIL:
+    log.warning("Failed to find library desktop_notify or dbus_next")
+
+SA_AVAIL = find_spec("simpleaudio") is not None
 
 
 class FDBController():
     """Handles querying VVV firebird databases locally"""
 
-    def __init__(self):
-        args, _ = parse_args()
-        self.config = init_config(args)
+    def __init__(self, config=None, dispatch=None):
+        """config is read from file and command line arguments if not given.
+        dispatch(func, *args) is called to run func in the thread owning the
+        notifiers, Clipster passes GLib.idle_add. Defaults to calling func."""
+        if config is None:
+            args, _ = parse_args()
+            config = init_config(args)
+        self.config = config
         self.is_disabled = False
+        self.dispatch = dispatch or (lambda func, *args: func(*args))
+        # Duration of each stage of lookups, see stats()
+        self.latency = LatencyStats()
+        # Queries slower than slow_query_ms, with their plan [int]
+        self.slow_log = None
+        if self.config.getint('clipfdb', "slow_query_ms") > 0:
+            self.slow_log = SlowQueryLog(
+                path.join(self.config.get('clipfdb', "data_dir"), "slow_queries.log"),
+                self.config.getint('clipfdb', "slow_query_ms") / 1000,
+                self.config.getint('clipfdb', "slow_query_log_kb") * 1024)
+        # cProfile and tracemalloc, see profile_toggle()
+        self.profiler = Profiler(path.join(self.config.get('clipfdb', "data_dir"), "profiles"))
+        # Clipboard events recorded for tools/replay.py, see record()
+        self.recorder = None
+        if self.config.get('clipfdb', "record_file"):
+            try:
+                self.recorder = ClipboardRecorder(self.config.get('clipfdb', "record_file"))
+            except OSError as e:
+                print(f"{BColors.FAIL}Not recording clipboard events: {e}{BColors.ENDC}")
 
         self.wants_terminal_output = self.config.getboolean('clipfdb', "terminal_output")
+        # Set up by init_databases(), none while disabled
+        self.db_handles = []
 
         if not self.wants_terminal_output \
         and not self.config.getboolean('clipfdb', 'sound_notifications') \
@@ -70,8 +94,12 @@ class FDBController():
         self.notifier = Notifier(self.config)
         self.snd_notifier = SoundNotifier(self.config)
 
-        self.notifier.simple_notify("Started clipfdb")
-        self.snd_notifier.play(self.snd_notifier.startup_sound)
+        # Connect to databases in the background, don't wait for them
+        self.fast_start = self.config.getboolean('clipfdb', "fast_start")
+        if self.fast_start:
+            self.dispatch(self.announce, "Started clipfdb")
+        else:
+            self.announce("Started clipfdb")
 
         # Sets up the FIREBIRD env var for securty2.fdb lookup
         # Point to our current VVV firebird database (for security2.fdb)
@@ -82,6 +110,38 @@ class FDBController():
         # TODO add to config file options for alternative sorting
         setlocale(LC_ALL, "")
 
+        # Seconds to wait for each database before giving up on it [float]
+        self.query_timeout = self.config.getfloat('clipfdb', "query_timeout")
+        # Report the results of every database together [bool]
+        self.merge_results = self.config.getboolean('clipfdb', "merge_results")
+        self.max_results = self.config.getint('clipfdb', "max_results")
+        self.relevance = self.config.get('clipfdb', "ranking") == "relevance"
+        # Seconds after which results found so far are notified, then
+        # updated at the same interval while a query goes on [float]
+        self.progress_interval = self.config.getint('clipfdb', "progress_interval_ms") / 1000
+        # Each database gets its own thread, the only one using its connection
+        self.workers = {}
+        # Count every match of a query when only the first max_results were
+        # fetched, in a second thread (and connection) of each database
+        self.accurate_counts = self.config.getboolean('clipfdb', "accurate_counts")
+        self.counters = {}
+        # In-memory structures of a database which changed are rebuilt in a
+        # thread of their own, see submit_refresh()
+        self.refreshers = {}
+        self.refreshing = {}
+        # (future, submission time) of the last job submitted to each
+        # database, to skip the ones that seem hung
+        self.in_flight = {}
+        self.cache = QueryCache(
+            max_entries=self.config.getint('clipfdb', "cache_max_entries"),
+            max_bytes=self.config.getint('clipfdb', "cache_max_kb") * 1024,
+            ttl=self.config.getfloat('clipfdb', "cache_ttl"))
+        # Lookups are started from here, away from the caller's thread
+        self.admission = Admission(
+            self.run_lookup,
+            debounce=self.config.getint('clipfdb', "debounce_ms") / 1000,
+            max_in_flight=self.config.getint('clipfdb', "max_in_flight"))
+
         self.db_handles = self.init_databases()
 
     def init_databases(self) -> List:
@@ -95,21 +155,70 @@ class FDBController():
                 self.config.get(db_section, 'filepath'),
                 self.config.get(db_section, 'username'),
                 self.config.get(db_section, 'password'),
-                self.config
+                self.config,
+                db_section,
+                latency=self.latency
             )
             handles.append(dbh)
-            try:
-                dbh.init_connection()
-            except Exception as e:
-                # FIXME have red background on notification
-                self.notifier.simple_notify(f"{e}", timeout=5000)
-                continue
+            self.workers[dbh] = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix=f"clipfdb-{db_section}")
+            if self.accurate_counts:
+                self.counters[dbh] = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix=f"clipfdb-{db_section}-count")
+            self.refreshers[dbh] = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix=f"clipfdb-{db_section}-refresh")
+            if self.fast_start:
+                self.submit_job(dbh, self.connect, dbh)
+            else:
+                self.connect(dbh)
 
-        print("Number of active databases: "
-             f"{len([h for h in handles if h.con is not None])} "
-             f"/ {len(handles)}.")
+        if not self.fast_start:
+            print("Number of active databases: "
+                 f"{len([h for h in handles if h.con is not None])} "
+                 f"/ {len(handles)}.")
         return handles
 
+    def announce(self, message):
+        """Notify that clipfdb started."""
+        self.notifier.simple_notify(message)
+        self.snd_notifier.play(self.snd_notifier.startup_sound)
+
+    def connect(self, db):
+        """Open the connection of a database and load it in memory. Return
+        False if the connection failed."""
+        start = monotonic()
+        try:
+            db.init_connection()
+        except Exception as e:
+            # FIXME have red background on notification
+            self.dispatch(self.notifier.simple_notify, f"{e}", 5000)
+            return False
+        self.refresh(db)
+        db.state = "ready"
+        if self.fast_start:
+            print(f"Database {db.db_filename} ready in {monotonic() - start:.2f}s.")
+        return True
+
+    def readiness(self):
+        """State of each database: pending, connecting, failed or ready."""
+        return {db.db_filename: db.state for db in self.db_handles}
+
+    def refresh(self, db, own_connection=False):
+        """Build the optional in-memory structures of a database. Queries
+        fall back to SQL for those that fail."""
+        try:
+            db.refresh(own_connection)
+        except Exception as e:
+            print(f"{BColors.FAIL}Failed to load {db.db_filename} in memory: {e}{BColors.ENDC}")
+            return
+        if self.wants_terminal_output:
+            if db.index is not None:
+                print(f"Indexed {len(db.index.catalog)} files from {db.db_filename}.")
+            if db.directory_tree is not None:
+                print(f"Cached {len(db.directory_tree)} directories from {db.db_filename}.")
+            if db.bloom is not None:
+                print(f"Summary of {db.db_filename}: {db.bloom.report()}.")
+
     def active_toggle(self, signum, stackframe):
         """Signal handler for SIGUSR1. Called from Clipster."""
 
@@ -125,6 +234,8 @@ class FDBController():
             self.notifier.simple_notify("Paused clipfdb")
             if self.wants_terminal_output:
                 print("Paused clipfdb.")
+                print(f"Cache: {self.cache.stats()}")
+                self.print_bloom_skips()
         else:
             self.snd_notifier.play(self.snd_notifier.startup_sound)
             self.notifier.simple_notify("Resumed clipfdb")
@@ -132,25 +243,131 @@ class FDBController():
                 print("Resumed clipfdb.")
             for db in self.db_handles:
                 if db.con is None:
-                    try:
-                        db.init_connection()
-                    except Exception as e:
-                        # FIXME have red background on notification
-                        self.notifier.simple_notify(f"{e}", timeout=5000)
-                        continue
+                    if db.state != "connecting":
+                        self.submit_job(db, self.connect, db)
+                # Pick up changes made to the database while we were paused
+                elif db.is_stale():
+                    self.submit_refresh(db)
+
+    def profile_toggle(self, signum=None, stackframe=None):
+        """Signal handler for SIGUSR2, also called by Clipster Daemon for
+        `clipster --profile`. Starts profiling lookups, or stops and writes
+        reports to the profiles directory of data_dir. Returns
+        {"profiling": bool, "files": [paths of the reports written]}."""
+        try:
+            files = self.profiler.toggle()
+        except Exception as e:
+            print(f"{BColors.FAIL}Profiling failed: {e}{BColors.ENDC}")
+            return {"profiling": self.profiler.running, "files": [], "error": str(e)}
+        if self.profiler.running:
+            print(f"Started profiling, stop to write reports to {self.profiler.directory}.")
+        else:
+            print("Stopped profiling, wrote:\n  " + "\n  ".join(files))
+        return {"profiling": self.profiler.running, "files": files}
 
     def exit(self):
         """Called from Clipster Daemon."""
+        if self.profiler.running:
+            self.profile_toggle()
+        if self.recorder is not None:
+            self.recorder.close()
+        if self.slow_log is not None:
+            self.slow_log.close()
+
         if getattr(self, "snd_notifier", None) is not None:
             self.snd_notifier.play(self.snd_notifier.shutdown_sound)
+            self.snd_notifier.close()
 
         if getattr(self, "notifier", None) is not None:
             self.notifier.simple_notify("Exited clipfdb and Clipster")
+            self.notifier.close()
+
+        if getattr(self, "admission", None) is not None:
+            self.admission.shutdown()
+        for db in getattr(self, "db_handles", ()):
+            self.workers[db].shutdown(wait=False, cancel_futures=True)
+            if db in self.counters:
+                self.counters[db].shutdown(wait=False, cancel_futures=True)
+            self.refreshers[db].shutdown(wait=False, cancel_futures=True)
+            db.exit()
+
+        if getattr(self, "cache", None) is not None:
+            print(f"Cache: {self.cache.stats()}")
+            self.print_bloom_skips()
         # self.parent.exit()  # Clipster Daemon object is set as parent
         # sys.exit(0)
 
-    def query(self, clipboard_str):
-        """Starts the query process to FDB databases"""
+    def print_bloom_skips(self):
+        skips = {db.db_filename: db.bloom_skips
+                 for db in self.db_handles if db.bloom is not None}
+        if skips:
+            print(f"Queries skipped thanks to summaries: {skips}")
+
+    def stats(self):
+        """Latency percentiles of each stage, per database, and counters of
+        the cache, admission and notifiers. Sent to `clipster --stats`."""
+        stats = {"disabled": self.is_disabled,
+                 "latency": self.latency.snapshot()}
+        if self.recorder is not None:
+            stats["recorded"] = self.recorder.recorded
+        if self.slow_log is not None:
+            stats["slow_queries"] = self.slow_log.logged
+        if getattr(self, "notifier", None) is None:
+            # Nothing to report with every output turned off
+            return stats
+        stats["cache"] = self.cache.stats()
+        stats["admission"] = self.admission.stats()
+        stats["databases"] = {
+            db.db_filename: {"state": db.state, "generation": db.generation,
+                             "bloom_skips": db.bloom_skips}
+            for db in self.db_handles}
+        stats["notifications"] = self.notifier.stats()
+        stats["sounds"] = self.snd_notifier.stats()
+        return stats
+
+    def submit(self, clipboard_str):
+        """Run query() in the background, results are reported through
+        self.dispatch. Return immediately."""
+        if self.is_disabled:
+            return
+        self.admission.submit(clipboard_str)
+
+    def record(self, selection, text):
+        """Called by Clipster Daemon for every clipboard event, whether
+        looked up or not."""
+        if self.recorder is not None:
+            self.recorder.record(selection, text)
+
+    def run_lookup(self, lookup):
+        """Called by self.admission, in a background thread."""
+        self.profiler.call(self.query, lookup.text, lookup)
+
+    def submit_job(self, db, func, *args):
+        """Queue func(*args) in the worker thread of db."""
+        future = self.workers[db].submit(self.profiler.call, func, *args)
+        self.in_flight[db] = (future, monotonic())
+        return future
+
+    def submit_refresh(self, db):
+        """Rebuild the in-memory structures of db in its refresh thread,
+        unless that is already under way. Its worker goes on answering
+        queries with SQL meanwhile."""
+        future = self.refreshing.get(db)
+        if future is not None and not future.done():
+            return
+        self.refreshing[db] = self.refreshers[db].submit(
+            self.profiler.call, self.refresh, db, True)
+
+    def is_hung(self, db):
+        """True if the last job submitted to db is still not done after
+        query_timeout. New lookups would only queue up behind it."""
+        future, submitted = self.in_flight.get(db, (None, 0))
+        return future is not None and not future.done() \
+            and monotonic() - submitted > self.query_timeout
+
+    def query(self, clipboard_str, lookup=None):
+        """Starts the query process to FDB databases. lookup is given by
+        self.admission, to stop early once it is superseded."""
 
         if self.is_disabled:
             return
@@ -158,38 +375,324 @@ class FDBController():
         if len(clipboard_str) > 200:
             return
 
-        query_str = filter_content(clipboard_str)
+        start = perf_counter()
+        with self.latency.span(ALL, "filter"):
+            query_str = filter_content(clipboard_str)
 
         if not query_str:
             return
 
-        _q = []
-
+        # Query every database at the same time. Without merge_results, each
+        # one is reported as soon as it is done so that a slow one doesn't
+        # hold back the others. Otherwise they are reported together.
+        merged = self.make_merged_dict(query_str) if self.merge_results else None
+        parts = []
+        # db -> query_dict of the partial results notified, see query_db()
+        progress = {}
+
+        def deliver(db, query_dict):
+            if merged is not None:
+                parts.append((db, query_dict))
+                merged['finished'][db.db_filename] = query_dict
+                return
+            self.dispatch(self.report, query_dict)
+            self.submit_count(db, query_dict, lookup)
+
+        futures = {}
         for db in self.db_handles:
-            if db.con is None:
+            if db.state != "ready":
+                # Still connecting with fast_start, or unavailable
                 continue
-            query_dict = {}
-            query_dict['db_filename'] = db.db_filename
-            query_dict['original_query'] = query_str
-            try:
-                query_dict['found_words'],\
-                query_dict['count'] = db.query(query_str)
-            except Exception as e:
-                print(f"{BColors.FAIL}{e}{BColors.ENDC}")
+            with self.latency.span(db.db_filename, "bloom"):
+                may_contain = db.may_contain(query_str)
+            if not may_contain:
+                deliver(db, self.make_query_dict(db, query_str, ([], 0)))
                 continue
-            _q.append(query_dict)
-
-            if self.wants_terminal_output:
-                print_to_stdout(query_dict)
+            with self.latency.span(db.db_filename, "cache"):
+                cached = self.cache_get(db, query_str)
+            if cached is not None:
+                deliver(db, self.make_query_dict(db, query_str, cached))
+                continue
+            if self.is_hung(db):
+                print(f"{BColors.WARNING}Skipping {db.db_filename}, "
+                      f"still busy with a previous query.{BColors.ENDC}")
+                continue
+            futures[self.submit_job(
+                db, self.query_db, db, query_str, lookup, merged, progress)] = db
+
+        deadline = monotonic() + self.query_timeout
+        pending = set(futures)
+        while pending:
+            if lookup is not None and lookup.superseded:
+                # Let newer clipboard content go first in the workers
+                for future in pending:
+                    future.cancel()
+                return
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=min(remaining, 0.1),
+                                 return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.cancelled():
+                    continue
+                query_dict = future.result()
+                db = futures[future]
+                if db.is_stale():
+                    # Rebuilt in the background, the next queries use SQL
+                    # meanwhile
+                    self.submit_refresh(db)
+                if query_dict is not None:
+                    deliver(db, query_dict)
+
+        for future in pending:
+            print(f"{BColors.FAIL}Timed out after {self.query_timeout}s "
+                  f"waiting for {futures[future].db_filename}.{BColors.ENDC}")
+            self.latency.record(futures[future].db_filename, "query",
+                                self.query_timeout, error=True)
+            if futures[future] in progress:
+                self.dispatch(self.report_timeout, progress[futures[future]])
+        # Until every database was reported, or gave up on
+        self.latency.record(ALL, "lookup", perf_counter() - start, bool(pending))
+
+        if merged is not None and parts:
+            for _, query_dict in parts:
+                query_dict['merged'] = merged
+            self.dispatch(self.report_merged, merged, [q for _, q in parts])
+            # Counts are reported after the merged results they update
+            for db, query_dict in parts:
+                self.submit_count(db, query_dict, lookup)
+
+    def make_merged_dict(self, query_str):
+        """query_dict of the results of every database together."""
+        return {'db_filename': "", 'original_query': query_str,
+                'found_words': [], 'count': 0, 'exact': True,
+                # db_filename -> rows found so far, see report_merged_progress()
+                'partial_rows': {},
+                # db_filename -> query_dict of the databases done querying
+                'finished': {},
+                # Whether report_merged() sent the final results
+                'done': False}
+
+    def update_merged(self, merged, parts):
+        """Merge parts, the query_dicts of each database, into merged."""
+        merged['found_words'] = merge(
+            [(part['db_filename'], part['found_words']) for part in parts],
+            merged['original_query'], self.max_results, self.relevance)
+        # Rows found by several databases are merged, not counted once
+        merged['count'] = sum(part['count'] for part in parts)
+        merged['summed'] = len(parts) > 1
+        merged['exact'] = all(part.get('exact', True) for part in parts)
+        merged['partial'] = any(part.get('partial') for part in parts)
+        holding = [part['db_filename'] for part in parts if part['count'] > 0]
+        merged['db_filename'] = ", ".join(holding) if 0 < len(holding) <= 2 \
+            else f"{len(holding) or len(parts)} databases"
+
+    def report_merged_progress(self, merged, db, result_list, found_count):
+        """Notify the results found so far by every database, those done
+        querying included. Not once the final results were reported: a
+        database which timed out may still be streaming."""
+        if merged['done']:
+            return
+        merged['partial_rows'][db.db_filename] = (result_list, found_count)
+        finished = dict(merged['finished'])
+        parts = list(finished.values()) + [
+            {'db_filename': db_filename, 'found_words': rows,
+             'count': count, 'partial': True}
+            for db_filename, (rows, count) in merged['partial_rows'].items()
+            if db_filename not in finished]
+        self.update_merged(merged, parts)
+        self.notifier.notify(merged)
+
+    def report_merged(self, merged, parts):
+        """Output the results of every database at once."""
+        merged['done'] = True
+        merged['parts'] = parts
+        self.update_merged(merged, parts)
+        self.report(merged)
+
+    def cache_key(self, db, query_str):
+        return QueryCache.make_key(db.db_filepath, query_str,
+                                   db.max_results, db.wants_parent_directories)
+
+    def cache_get(self, db, query_str):
+        """Cached (result_list, found_count) of db for query_str, if the
+        database hasn't changed since."""
+        if not db.is_unchanged():
+            return None
+        return self.cache.get(self.cache_key(db, query_str), db.generation)
+
+    def make_query_dict(self, db, query_str, result):
+        query_dict = {}
+        query_dict['db_filename'] = db.db_filename
+        query_dict['original_query'] = query_str
+        query_dict['found_words'], query_dict['count'] = result
+        # Whether count is the total, or only the number of rows fetched
+        query_dict['exact'] = not (
+            0 < db.fetch_limit == query_dict['count'])
+        return query_dict
+
+    def submit_count(self, db, query_dict, lookup=None):
+        """Count every match in the background if query_dict only has the
+        first ones."""
+        if query_dict['exact'] or db not in self.counters:
+            return
+        generation = db.generation if db.is_unchanged() else None
+        self.counters[db].submit(self.profiler.call, self.count_db, db,
+                                 query_dict, lookup, generation)
 
-        # TODO separate thread for concurency / event loop
-        for query in _q:
-            self.notifier.notify(query)
-            if query['count'] > 0:
+    def count_db(self, db, query_dict, lookup, generation):
+        """Run in the counting thread of db."""
+        if lookup is not None and lookup.superseded:
+            return
+        query_str = query_dict['original_query']
+        try:
+            with self.latency.span(db.db_filename, "count"):
+                count = db.count(query_str)
+        except Exception as e:
+            print(f"{BColors.FAIL}Error while counting {query_str} "
+                  f"in {db.db_filename}: {e}{BColors.ENDC}")
+            return
+        if generation is not None and generation == db.generation:
+            self.cache.put(self.cache_key(db, query_str), generation,
+                           (query_dict['found_words'], count))
+        if lookup is not None and lookup.superseded:
+            return
+        self.dispatch(self.report_count, query_dict, count)
+
+    def query_db(self, db, query_str, lookup=None, merged=None, partial=None):
+        """Run in the database's worker thread. Return the query_dict with
+        its results, None on failure or if superseded before starting. The
+        query_dict of partial results notified meanwhile is put in partial,
+        keyed by db."""
+        if lookup is not None and lookup.superseded:
+            return None
+        generation = db.generation if db.is_unchanged() else None
+        # Partial results notified while the query goes on
+        progress = None
+        # Parent directories resolved so far, see FDB.resolve_paths()
+        directories = {}
+        result_list = []
+        found_count = 0
+        start = perf_counter()
+        last_update = monotonic()
+        try:
+            stream = db.stream(query_str)
+            for batch, found_count in stream:
+                if lookup is not None and lookup.superseded:
+                    stream.close()
+                    self.log_if_slow(db, query_str, perf_counter() - start,
+                                     len(result_list), superseded=True)
+                    return None
+                result_list.extend(batch)
+                now = monotonic()
+                if self.progress_interval > 0 and batch \
+                and now - last_update >= self.progress_interval:
+                    last_update = now
+                    ranked = db.resolve_paths(db.rank_rows(result_list, query_str),
+                                              directories)
+                    if merged is not None:
+                        self.dispatch(self.report_merged_progress, merged, db,
+                                      ranked, found_count)
+                        continue
+                    if progress is None:
+                        progress = self.make_query_dict(db, query_str, ([], 0))
+                        progress['partial'] = True
+                        if partial is not None:
+                            partial[db] = progress
+                    self.dispatch(self.report_progress, progress, ranked, found_count)
+        except Exception as e:
+            print(f"{BColors.FAIL}{e}{BColors.ENDC}")
+            self.latency.record(db.db_filename, "query", perf_counter() - start, True)
+            self.log_if_slow(db, query_str, perf_counter() - start,
+                             len(result_list), error=str(e))
+            return None
+        rank_start = perf_counter()
+        ranked_rows = db.rank_rows(result_list, query_str)
+        ranked = perf_counter()
+        result = (db.resolve_paths(ranked_rows, directories), found_count)
+        done = perf_counter()
+        self.latency.record(db.db_filename, "rank", ranked - rank_start)
+        self.latency.record(db.db_filename, "query", done - start,
+                            db.last_query_failed)
+        self.log_if_slow(db, query_str, done - start, found_count,
+                         rank=ranked - rank_start, failed=db.last_query_failed)
+        if generation is not None and not db.last_query_failed:
+            self.cache.put(self.cache_key(db, query_str), generation, result)
+        query_dict = self.make_query_dict(db, query_str, result)
+        if progress is not None:
+            query_dict['progress'] = progress
+        return query_dict
+
+    def log_if_slow(self, db, query_str, seconds, rows, rank=None, **details):
+        """Write the query to the slow query log if it took seconds or more.
+        Called from the worker thread of db, right after db.stream()."""
+        if self.slow_log is None or not self.slow_log.is_slow(seconds):
+            return
+        timings = dict(db.last_timings)
+        if rank is not None:
+            timings['rank'] = rank
+        self.slow_log.write({
+            'db': db.db_filename,
+            'query': query_str,
+            'strategy': db.choose_strategy(query_str),
+            'rows': rows,
+            'total_ms': round(seconds * 1000, 1),
+            'stages_ms': {stage: round(t * 1000, 1) for stage, t in timings.items()},
+            'plan': db.last_plan(),
+            **details})
+
+    def report_progress(self, progress, result_list, found_count):
+        """Notify the results of one database found so far."""
+        if progress.get('timed_out'):
+            # Still streaming, but no longer waited for
+            return
+        progress['found_words'], progress['count'] = result_list, found_count
+        self.notifier.notify(progress)
+
+    def report_timeout(self, progress):
+        """Replace the partial results of a database that was given up on,
+        which no final results will replace."""
+        progress['timed_out'] = True
+        if self.wants_terminal_output:
+            print_to_stdout(progress)
+        self.notifier.notify(progress)
+
+    def report(self, query_dict):
+        """Output the results of one database. Returns None, so that it is
+        removed from GLib's idle sources once run."""
+        progress = query_dict.pop('progress', None)
+        if progress is not None:
+            # Replace the notification of partial results. Its id may only
+            # be known once it is shown, see notification_id().
+            query_dict['replaces'] = progress
+        if self.wants_terminal_output:
+            print_to_stdout(query_dict)
+
+        with self.latency.span(ALL, "notify"):
+            self.notifier.notify(query_dict)
+        with self.latency.span(ALL, "sound"):
+            if query_dict['count'] > 0:
                 self.snd_notifier.play(self.snd_notifier.success_sound)
             else:
                 self.snd_notifier.play(self.snd_notifier.failure_sound)
 
+    def report_count(self, query_dict, count):
+        """Update the results reported for one database with their total
+        count."""
+        query_dict['count'] = count
+        query_dict['exact'] = True
+        if self.wants_terminal_output:
+            print(f"Found {BColors.OKGREEN}{count}{BColors.ENDC} in total "
+                  f"for \"{BColors.BOLD}{query_dict['original_query']}\"{BColors.ENDC} "
+                  f"in {BColors.BOLD}{query_dict['db_filename']}{BColors.ENDC}")
+        merged = query_dict.get('merged')
+        if merged is not None:
+            self.update_merged(merged, merged['parts'])
+            query_dict = merged
+        # Replaces the notification sent by report()
+        self.notifier.notify(query_dict)
+
 
 # e.g. (tumblr_abcdeo1_)raw.jpg
 # repattern_tumblr_full = re.compile(r'(tumblr_.*_).*\..*')
@@ -202,6 +705,14 @@ repattern_tumblr_redirect = re.compile(r't\.umblr\.com\/redirect\?z=(.*)&t=.*',
 repattern_extensions = re.compile(r'^(.*)(?:\.(?:mp4|webm|avi|mov|mkv|zip|rar|7z|gif|jpeg|jpg|png))$', re.I)
 # https://pbs.twimg.com/media/XXXXXXXXXXXXXXX?format=jpg&name=orig
 tter_repattern = re.compile(r'https?:\/\/pbs\.twimg\.com\/media\/(.{15})\?.*')
+# IDs as returned by filter_content(), to be found at the start of file names
+repattern_prefix_id = re.compile(r'^tumblr_(?:inline_)?[0-9a-z]+$', re.I)
+repattern_tter_id = re.compile(r'^(?=.*[0-9])(?=.*[a-z])(?=.*[A-Z])[\w-]{15}$')
+# Expression used by indexes which FDB can take advantage of, see
+# tools/provision_indexes.py
+NAME_INDEX_EXPRESSION = "UPPER(FILE_NAME)"
+# Characters to escape in LIKE patterns
+repattern_like_special = re.compile(r'[\\%_]')
 
 
 def filter_content(clipboard_str):
@@ -264,20 +775,82 @@ def filter_content(clipboard_str):
 
 class FDB():
     """Handle to a Firebird database."""
-    def __init__(self, databasepath, username, password, config):
+    def __init__(self, databasepath, username, password, config, section=None,
+                 latency=None):
         self.db_filepath = databasepath
         self.db_filename = databasepath.split("/")[-1]
         self.username = username
         self.password = password
 
         self.max_results = config.getint('clipfdb', "max_results")
+        # Results are ordered by relevance, or alphabetically [relevance|alphabetical]
+        self.relevance = config.get('clipfdb', "ranking") == "relevance"
+        # Rows fetched to pick the most relevant max_results from
+        self.fetch_limit = self.max_results
+        if self.relevance and self.max_results > 0:
+            self.fetch_limit = max(self.max_results,
+                                   config.getint('clipfdb', "rank_candidates"))
+        # Rows fetched at once, see stream()
+        self.batch_size = max(1, config.getint('clipfdb', "stream_batch_size"))
         self.wants_parent_directories = config.getboolean('clipfdb', "parent_directories")
+        # pending, connecting, failed or ready
+        self.state = "pending"
+        # Optional in-memory index answering substring queries [no|trigram]
+        self.search_index = config.get('clipfdb', "search_index")
+        self.index = None
+        # Resolve parent directories from memory instead of SP_GET_FULL_PATH
+        self.cache_directories = config.getboolean('clipfdb', "cache_directories")
+        self.directory_tree = None
+        # Size and mtime of the database file when the structures above were
+        # last built
+        self.signature = None
+        # Same, taken right before connecting, see init_connection()
+        self.opening_signature = None
+        # Our transactions in progress on any connection, and whether the
+        # file was as we left it when they started, see own_transaction()
+        self.transactions = 0
+        self.tracking = False
+        self.signature_lock = Lock()
+        # How to match file names in SQL [auto|like|containing|starting]
+        self.query_strategy = config.get('clipfdb', "query_strategy")
+        self.cursor = None
+        self.statements = {}
+        # Name of an index on UPPER(FILE_NAME), found when connecting
+        self.name_index = None
+        # Bumped whenever the database changed, to invalidate cached results
+        self.generation = 0
+        self.last_query_failed = False
+        # Statements run by the last stream(), and the seconds spent in each
+        # of its stages, for the slow query log
+        self.last_statements = []
+        self.last_timings = {}
+        # Separate connection for COUNT queries, which may run while the main
+        # one is busy with the next lookup
+        self.count_con = None
+        # Keep the rows the index is built from in a memory-mapped file,
+        # reused as long as the database file does not change.
+        self.snapshot_path = None
+        if section and config.getboolean('clipfdb', "index_snapshots"):
+            self.snapshot_path = path.join(
+                config.get('clipfdb', "data_dir"), "snapshots", f"{section}.snapshot")
+        # Bloom filter of the file names, to skip queries which can't match
+        self.bloom = None
+        self.bloom_path = None
+        self.bloom_fp_rate = config.getfloat('clipfdb', "bloom_fp_rate")
+        self.bloom_skips = 0
+        if config.getboolean('clipfdb', "bloom_summary"):
+            # In data_dir rather than next to the config, which may be a
+            # system-wide one we can't write to, or not exist at all
+            self.bloom_path = path.join(
+                config.get('clipfdb', "data_dir"), "summaries",
+                f"{section or self.db_filename}.bloom")
+        # Where the duration of each query stage is recorded
+        self.latency = latency if latency is not None else LatencyStats()
         self.con = None
 
-    def init_connection(self):
-        con = None
-        try:
-            con = fdb.connect(
+    def open_connection(self):
+        import fdb
+        return fdb.connect(
             database=self.db_filepath,
             # dsn='localhost:~/test/CGI.vvv', #localhost:3050
             user=self.username, password=self.password,
@@ -287,33 +860,379 @@ class FDB():
             # Or in case we still can't find it somehow (with fdb pypi package)
             # fb_library_name="/usr/lib/libfbclient.so" #HACK HACK
         )
+
+    def init_connection(self):
+        con = None
+        self.state = "connecting"
+        # Our own transactions, starting with find_name_index() below, touch
+        # the database file: saved snapshots and summaries are checked
+        # against its state before them, see refresh().
+        self.opening_signature = file_signature(self.db_filepath)
+        try:
+            con = self.open_connection()
         except Exception as e:
+            self.state = "failed"
             print(f"No connection to \"{self.db_filename}\": {e}")
             raise Exception(f"No connection to \"{self.db_filename}\": {e}")
 
         self.con = con
+        # Prepared statements belong to the cursor of this connection
+        self.cursor = None
+        self.statements = {}
+        try:
+            self.name_index = find_name_index(con)
+            con.commit()
+        except Exception as e:
+            print(f"Failed to list indexes of \"{self.db_filename}\": {e}")
+            self.name_index = None
+        if self.name_index is not None:
+            print(f"Using index {self.name_index} of \"{self.db_filename}\".")
         return con
 
-    def make_select(self, query_str):
-        # Add quotes after single quote to escape for SQL statements
-        if "'" in query_str:
-            query_str = query_str.replace("'", "''")
-
+    def choose_strategy(self, query_str):
+        """Pick the SQL predicate for query_str [starting|containing|like].
+        IDs extracted by filter_content() are file name prefixes, which
+        STARTING WITH can look up in an index."""
+        if self.query_strategy != "auto":
+            return self.query_strategy
+        if repattern_prefix_id.match(query_str) or repattern_tter_id.match(query_str):
+            return "starting"
+        if "_" in query_str or "%" in query_str:
+            # LIKE wildcards, CONTAINING takes them literally
+            return "containing"
+        return "like"
+
+    def make_select(self, query_str, strategy=None):
+        """Return the parameterized SELECT statement for query_str, and its
+        parameters."""
+        if strategy is None:
+            strategy = self.choose_strategy(query_str)
+        limit = f"FIRST {self.fetch_limit} " if self.fetch_limit > 0 else ""
+
+        predicate, param = self.make_predicate(query_str, strategy)
+        return ("select " + limit + "FILE_NAME, FILE_SIZE, PATH_ID from FILES WHERE "
+                + predicate, (param,))
+
+    def make_count(self, query_str, strategy=None):
+        """Same as make_select(), counting every matching row instead."""
+        if strategy is None:
+            strategy = self.choose_strategy(query_str)
+        predicate, param = self.make_predicate(query_str, strategy)
+        return "select count(*) from FILES WHERE " + predicate, (param,)
+
+    @staticmethod
+    def make_predicate(query_str, strategy):
         # Case insensitivity
-        query_str = query_str.upper()
-
-        limit = f"FIRST {self.max_results}" if self.max_results > 0 else ""
-
-        # For some reason this does not work...
-        # SELECT = r"""select FILES.FILE_NAME, FILES.FILE_SIZE, FILES.PATH_ID from FILES WHERE UPPER (FILE_NAME) LIKE '%?%'"""
-        # stmt = cur.prep(SELECT)
+        if strategy == "starting":
+            predicate = "UPPER(FILE_NAME) STARTING WITH ?"
+            param = query_str.upper()
+        elif strategy == "containing":
+            predicate = "FILE_NAME CONTAINING ?"
+            param = query_str
+        else:
+            predicate = "UPPER(FILE_NAME) LIKE ? ESCAPE '\\'"
+            param = "%" + repattern_like_special.sub(r"\\\g<0>", query_str.upper()) + "%"
+        return predicate, param
+
+    def prepare(self, SELECT):
+        """Return the prepared statement for SELECT, prepared once per
+        connection so that Firebird doesn't parse and plan it again."""
+        statement = self.statements.get(SELECT)
+        if statement is None:
+            if self.cursor is None:
+                self.cursor = self.con.cursor()
+            statement = self.statements[SELECT] = self.cursor.prep(SELECT)
+        return statement
+
+    def fetch_all(self, con=None):
+        """Bulk read of the whole FILES table."""
+        cur = (con or self.con).cursor()
+        cur.execute("select FILE_NAME, FILE_SIZE, PATH_ID from FILES")
+        while rows := cur.fetchmany(10000):
+            yield from rows
+        cur.close()
+
+    def load_catalog(self, con, signature):
+        """Return every row of the FILES table, either from a snapshot taken
+        when the database file had that signature or from a bulk read of
+        the database."""
+        if self.snapshot_path is None:
+            return Catalog.from_rows(self.fetch_all(con))
+        snapshot = Snapshot.open(self.snapshot_path, self.db_filepath, signature)
+        if snapshot is None:
+            write_snapshot(self.snapshot_path, self.db_filepath, self.fetch_all(con))
+            snapshot = Snapshot.open(self.snapshot_path, self.db_filepath)
+        return snapshot
+
+    def build_index(self, con, signature):
+        """Load every file name and index its trigrams, or lay them out for
+        scanning."""
+        index_class = {"trigram": TrigramIndex, "scan": ScanIndex}.get(self.search_index)
+        if index_class is None:
+            raise ValueError(f"Unknown search_index \"{self.search_index}\"")
+        return index_class(self.load_catalog(con, signature))
+
+    def build_directory_tree(self, con):
+        """Load the PATHS table, to resolve parent directories in memory."""
+        cur = con.cursor()
+        cur.execute("select PATH_ID, FATHER_ID, PATH_NAME from PATHS")
+        tree = DirectoryTree.from_rows(
+            row for rows in iter(lambda: cur.fetchmany(10000), []) for row in rows)
+        cur.close()
+        # Make sure we agree with VVV on what a full path looks like
+        expected = {path_id: get_directory_value_from_db(con, path_id)
+                    for path_id in tree.sample(8)}
+        if not tree.calibrate(expected):
+            raise ValueError("PATHS table does not match SP_GET_FULL_PATH")
+        return tree
+
+    def encoded_names(self, con, index=None):
+        """Uppercased, utf-8 encoded file names and their count, from index
+        if given, otherwise from a bulk read."""
+        if index is None:
+            names = [(name or "").upper().encode("utf-8", errors="replace")
+                     for name, _, _ in self.fetch_all(con)]
+        elif isinstance(index.catalog, Snapshot):
+            names = index.catalog.upper_blob.tobytes().split(SEPARATOR)[:-1]
+        else:
+            names = [name.encode("utf-8", errors="replace")
+                     for name in index.catalog.upper_names]
+        return names, len(names)
+
+    def build_bloom(self, con, index=None):
+        """Summarize file names in a Bloom filter."""
+        names, _ = self.encoded_names(con, index)
+        return BloomSummary.build(names, self.bloom_fp_rate)
+
+    def load_bloom(self, signature):
+        """Reuse the Bloom filter we saved, if the database file still has
+        that signature, taken before our own transactions touched it."""
+        return BloomSummary.load(self.bloom_path, self.db_filepath, signature,
+                                 self.bloom_fp_rate)
+
+    def refresh(self, own_connection=False):
+        """(Re)build every enabled in-memory structure of the database, then
+        remember the state of its file. With own_connection, they are built
+        on a connection of their own, queries going on meanwhile with SQL on
+        ours, and swapped in once they are all ready."""
+        # Before our transactions below, or those made since connecting
+        signature = self.opening_signature or file_signature(self.db_filepath)
+        self.opening_signature = None
+        con = self.open_connection() if own_connection else self.con
+        # Not to be used until swapped, see is_unchanged()
+        self.signature = None
+        self.generation += 1
+        index = directory_tree = None
+        bloom = self.load_bloom(signature) if self.bloom_path is not None else None
+        try:
+            if self.search_index != "no":
+                try:
+                    index = self.build_index(con, signature)
+                except Exception as e:
+                    print(f"{BColors.FAIL}Failed to index {self.db_filename}: {e}{BColors.ENDC}")
+            if self.wants_parent_directories and self.cache_directories:
+                try:
+                    directory_tree = self.build_directory_tree(con)
+                except Exception as e:
+                    print(f"{BColors.FAIL}Failed to load directories of "
+                          f"{self.db_filename}: {e}{BColors.ENDC}")
+            if self.bloom_path is not None and bloom is None:
+                try:
+                    bloom = self.build_bloom(con, index)
+                except Exception as e:
+                    print(f"{BColors.FAIL}Failed to summarize {self.db_filename}: {e}{BColors.ENDC}")
+            con.commit()
+        finally:
+            if own_connection:
+                try:
+                    con.close()
+                except Exception as e:
+                    print(f"Failed to close connection to \"{self.db_filename}\": {e}")
+        previous = self.index
+        self.index, self.directory_tree, self.bloom = index, directory_tree, bloom
+        if previous is not None and isinstance(previous.catalog, Snapshot):
+            previous.catalog.close()
+        # Our own transactions touch the database file, so only take its
+        # signature once we are done with them. Those still going on in
+        # other threads are followed from there on.
+        with self.signature_lock:
+            self.signature = file_signature(self.db_filepath)
+            self.tracking = True
+        self.stamp_snapshot()
+        self.stamp_bloom()
+
+    def is_stale(self):
+        """True if the database file changed since our last refresh."""
+        return self.signature is not None and not self.is_unchanged()
+
+    def is_unchanged(self):
+        """True if the database file is as we left it after our last refresh,
+        or only touched by our transactions still in progress."""
+        current = file_signature(self.db_filepath)
+        with self.signature_lock:
+            if self.signature is None or current is None:
+                return False
+            if current == self.signature:
+                return True
+            return self.transactions > 0 and self.tracking \
+                and current[0] == self.signature[0]
+
+    @contextmanager
+    def own_transaction(self):
+        """Wraps our queries, on any connection. Firebird writes to the
+        database file when they run, which must not make our structures look
+        stale. If the file was as we left it when they started, only the
+        mtime they changed is taken as ours: a change of size means someone
+        else wrote to it meanwhile."""
+        with self.signature_lock:
+            if self.transactions == 0:
+                self.tracking = self.signature is not None \
+                    and file_signature(self.db_filepath) == self.signature
+            self.transactions += 1
+        try:
+            yield
+        finally:
+            after = file_signature(self.db_filepath)
+            with self.signature_lock:
+                self.transactions -= 1
+                if self.tracking and self.signature is not None \
+                and after is not None and after[0] == self.signature[0]:
+                    self.signature = after
+                else:
+                    self.tracking = False
+
+    def stamp_snapshot(self):
+        """Record our current signature in the snapshot, once we know the
+        database only changed because of our own transactions."""
+        if self.index is None or not isinstance(self.index.catalog, Snapshot) \
+        or self.index.catalog.signature == self.signature:
+            return
+        try:
+            restamp(self.snapshot_path, self.signature)
+            self.index.catalog.signature = self.signature
+        except OSError as e:
+            print(f"Failed to update snapshot {self.snapshot_path}: {e}")
+
+    def stamp_bloom(self):
+        """Save the Bloom filter along with our current signature."""
+        if self.bloom is None or self.bloom.signature == self.signature:
+            return
+        self.bloom.signature = self.signature
+        try:
+            self.bloom.save(self.bloom_path, self.db_filepath)
+        except OSError as e:
+            print(f"Failed to save summary {self.bloom_path}: {e}")
+
+    def may_contain(self, query_str):
+        """False if the Bloom filter rules out any match for query_str."""
+        if self.bloom is None or not self.is_unchanged() \
+        or self.bloom.may_contain(query_str):
+            return True
+        self.bloom_skips += 1
+        return False
 
-        return "select " + limit + " FILE_NAME, FILE_SIZE, PATH_ID from FILES WHERE UPPER \
-(FILE_NAME) LIKE '%" + query_str + "%'"
+    def exit(self):
+        """Keep our snapshot and summary usable on next start."""
+        if self.is_unchanged():
+            self.stamp_snapshot()
+            self.stamp_bloom()
+        if self.count_con is not None:
+            try:
+                self.count_con.close()
+            except Exception as e:
+                print(f"Failed to close connection to \"{self.db_filename}\": {e}")
+            self.count_con = None
+
+    def select_rows(self, query_str, unchanged):
+        """Yield (FILE_NAME, FILE_SIZE, PATH_ID) rows matching query_str,
+        from the index if it is usable, otherwise from SQL."""
+        if unchanged and self.index is not None:
+            yield from self.index.search(
+                query_str, self.fetch_limit,
+                prefix=self.choose_strategy(query_str) == "starting")
+            return
 
-    def query(self, query_str):
-        """Search our FDB for word
-        returns set(result_list), int(found_count)"""
+        strategy = self.choose_strategy(query_str)
+        seen = set()
+        if self.name_index is not None and strategy != "starting" \
+        and self.fetch_limit > 0:
+            # Names starting with query_str are found through the index. If
+            # there are enough of them, the full scan is not needed at all.
+            seen = set(self.execute_select(query_str, "starting"))
+            yield from seen
+            if len(seen) >= self.fetch_limit:
+                return
+
+        count = len(seen)
+        for row in self.execute_select(query_str, strategy):
+            if row in seen:
+                continue
+            yield row
+            count += 1
+            if count >= self.fetch_limit > 0:
+                break
+
+    def execute_select(self, query_str, strategy):
+        """Run the prepared SELECT for query_str, yield its rows."""
+        SELECT, params = self.make_select(query_str, strategy)
+        # print(f"DEBUG current active transactions: {con.get_active_transaction_count()}")
+        statement = self.prepare(SELECT)
+        self.last_statements.append(statement)
+        cur = self.cursor.execute(statement, params)
+        while rows := cur.fetchmany(self.batch_size):
+            yield from rows
+
+    def last_plan(self):
+        """How the last query was answered: Firebird's plan of each
+        statement run, or the in-memory index used."""
+        if not self.last_statements:
+            if "index" in self.last_timings:
+                return f"{type(self.index).__name__} (in memory)"
+            return None
+        plans = []
+        for statement in self.last_statements:
+            try:
+                plans.append(statement.plan)
+            except Exception as e:
+                plans.append(f"unavailable: {e}")
+        return "; ".join(plans)
+
+    def count_from_index(self, query_str):
+        return self.index.count(
+            query_str, prefix=self.choose_strategy(query_str) == "starting")
+
+    def count(self, query_str):
+        """Return how many rows match query_str, regardless of max_results.
+        May run in another thread than queries, it uses its own connection."""
+        unchanged = self.is_unchanged()
+        if unchanged and self.index is not None:
+            return self.count_from_index(query_str)
+        with self.own_transaction():
+            if self.count_con is None:
+                self.count_con = self.open_connection()
+            COUNT, params = self.make_count(query_str)
+            cur = self.count_con.cursor()
+            try:
+                return cur.execute(COUNT, params).fetchone()[0]
+            finally:
+                cur.close()
+                self.count_con.commit()
+
+    def get_full_path(self, path_id, unchanged):
+        """Full path of a PATH_ID, from the directory tree if it is usable,
+        otherwise from the database."""
+        if unchanged and self.directory_tree is not None:
+            full_path = self.directory_tree.full_path(path_id)
+            if full_path is not None:
+                return full_path
+        return get_directory_value_from_db(self.con, path_id)
+
+    def stream(self, query_str):
+        """Search our FDB for word, yielding (new_rows, found_count) as rows
+        are fetched, stream_batch_size at a time. Rows are
+        [FILE_NAME, FILE_SIZE, PATH_ID], in no particular order: rank them
+        with rank_rows(), then resolve_paths() of the ones kept. The last
+        found_count may be the total count."""
 
         if not self.con:
             raise Exception(f"No connection to database {self.db_filename}.")
@@ -323,50 +1242,88 @@ class FDB():
         # print("Security file for database is: ", con1.get_security_database_path() + "\n")
         # print(f"Active connections: {con1.get_connection_count()}")
 
-        cur = self.con.cursor()
+        # Whether our in-memory structures can be used
+        unchanged = self.is_unchanged()
 
-        SELECT = self.make_select(query_str)
-
-        # print(f"DEBUG current active transactions: {con.get_active_transaction_count()}")
+        found_count = 0
+        self.last_query_failed = False
+        # Seconds spent fetching rows, the time our caller takes between
+        # batches excluded
+        select_time = 0.0
+        self.last_statements = []
+        self.last_timings = {}
+        # Any SQL we run touches the database file, don't let that make our
+        # own structures look stale
+        with self.own_transaction():
+            try:
+                start = perf_counter()
+                rows = self.select_rows(query_str, unchanged)
+                while batch := [[row[0], row[1], row[2]]
+                                for row in islice(rows, self.batch_size)]:
+                    # print(f'{BColors.OKGREEN}Row: {row[0]} {str(row[1])} {row[2]}{BColors.ENDC}')
+                    found_count += len(batch)
+                    select_time += perf_counter() - start
+                    yield batch, found_count
+                    start = perf_counter()
+                select_time += perf_counter() - start
+
+                if found_count >= self.fetch_limit > 0 \
+                and unchanged and self.index is not None:
+                    # Counting from memory is cheap enough to do right away
+                    count_start = perf_counter()
+                    with self.latency.span(self.db_filename, "count"):
+                        found_count = self.count_from_index(query_str)
+                    self.last_timings["count"] = perf_counter() - count_start
+                    yield [], found_count
+            except Exception as e:
+                print(f"{BColors.FAIL}Error while looking up: {query_str}: {e}{BColors.ENDC}")
+                self.last_query_failed = True
+            finally:
+                source = "index" if unchanged and self.index is not None else "sql"
+                self.latency.record(self.db_filename, source, select_time,
+                                    self.last_query_failed)
+                self.last_timings[source] = select_time
+                # con.close()
+
+    def rank_rows(self, result_list, query_str):
+        """The max_results best rows of result_list, see ranking.rank()."""
+        return rank(result_list, query_str, self.max_results, self.relevance)
+
+    def resolve_paths(self, rows, directories=None):
+        """Return rows with their PATH_ID replaced by their parent
+        directories, if wanted. Meant for the rows kept once ranked, each
+        directory may take a query to resolve. directories holds those
+        already resolved, to share between calls for the same query."""
+        if not self.wants_parent_directories:
+            return rows
+        if directories is None:
+            directories = {}
+        start = perf_counter()
+        unchanged = self.is_unchanged()
+        with self.own_transaction():
+            try:
+                for path_id in {row[2] for row in rows} - directories.keys():
+                    directories[path_id] = strip_to_basepath(
+                        self.get_full_path(path_id, unchanged))
+            except Exception as e:
+                print(f"{BColors.FAIL}Error while resolving directories: {e}{BColors.ENDC}")
+                self.last_query_failed = True
+        resolved = [[name, size, directories.get(path_id, path_id)]
+                    for name, size, path_id in rows]
+        path_time = perf_counter() - start
+        self.latency.record(self.db_filename, "paths", path_time)
+        self.last_timings["paths"] = self.last_timings.get("paths", 0.0) + path_time
+        return resolved
 
+    def query(self, query_str):
+        """Search our FDB for word
+        returns list(result_list), int(found_count)"""
         result_list = []
-        result_dirs = set()
         found_count = 0
-        try:
-            # cur.execute(stmt, (query_str,))
-            for row in cur.execute(SELECT):
-                # print(f'{BColors.OKGREEN}Row: {row[0]} {str(row[1])} {row[2]}{BColors.ENDC}')
-                result_list.append([row[0], row[1], row[2]])
-                result_dirs.add(row[2])
-
-                found_count += 1
-                # Obsolete way of limiting result output
-                # if found_count >= self.max_results:
-                #     break
-
-            # result_list.sort(key=itemgetter(0, 1)) #sort alphabetically, then by size, but ignore case
-            # Sort alphabetically, case insensitive:
-            result_list.sort(key=locale_keyfunc(itemgetter(0)))
-            # print(BColors.OKGREEN + "DEBUG found_count: " + str(found_count) + BColors.ENDC)
-            # print(BColors.OKGREEN + "DEBUG result_list: " + str(result_list) + BColors.ENDC)
-
-            # Retrieve parent directory as well
-            if self.wants_parent_directories:
-                directory_dict = {}
-                # Assign pathnames corresponding to each path_id
-                for path_id in result_dirs:
-                    directory_dict[path_id] = strip_to_basepath(
-                        get_directory_value_from_db(self.con, path_id))
-
-                # replace path_id in our result with pathname
-                for item in result_list:
-                    if directory_dict.get(item[2]) is not None:
-                        item[2] = directory_dict.get(item[2])
-        except Exception as e:
-            print(f"{BColors.FAIL}Error while looking up: {query_str}: {e}{BColors.ENDC}")
-        # finally:
-            # con.close()
-        return (result_list, found_count)
+        for batch, found_count in self.stream(query_str):
+            result_list.extend(batch)
+        return (self.resolve_paths(self.rank_rows(result_list, query_str)),
+                found_count)
 
 
 def strip_to_basepath(pathstr):
@@ -385,6 +1342,20 @@ def strip_to_basepath(pathstr):
         return "/".join(_list) # unnecessary?
 
 
+def find_name_index(con):
+    """Return the name of an active expression index on UPPER(FILE_NAME) in
+    the FILES table, None if there is none (stock VVV databases)."""
+    cur = con.cursor()
+    cur.execute("select RDB$INDEX_NAME, RDB$EXPRESSION_SOURCE from RDB$INDICES "
+                "where RDB$RELATION_NAME = 'FILES' "
+                "and RDB$EXPRESSION_SOURCE is not null "
+                "and coalesce(RDB$INDEX_INACTIVE, 0) = 0")
+    for name, source in cur.fetchall():
+        if NAME_INDEX_EXPRESSION in re.sub(r'\s', '', str(source)).upper():
+            return name.strip()
+    return None
+
+
 def get_directory_value_from_db(con, dir_id):
     """Retrieve the full path corresponding to PATH_ID from VVV's procedure"""
     cur = con.cursor()
@@ -411,12 +1382,48 @@ def print_to_stdout(query_dict):
             result_list += "".join([item,"\t",bytes_2_human_readable(size),"\t",str(pardir),"\n"])
             color = BColors.OKGREEN
 
-    print(f"Found {color}{query_dict.get('count')}{BColors.ENDC} \
+    print(f"Found {color}{count_str(query_dict)}{BColors.ENDC} \
 for \"{BColors.BOLD}{query_dict.get('original_query')}\"{BColors.ENDC} \
 in {BColors.BOLD}{query_dict.get('db_filename')}{BColors.ENDC}\n\
 {color}{result_list}{BColors.ENDC}")
 
 
+def count_str(query_dict):
+    """Count of results, "20+" if there may be more than the 20 found."""
+    if query_dict.get('timed_out'):
+        count = f"{query_dict.get('count')} so far (timed out)"
+    elif query_dict.get('partial'):
+        count = f"{query_dict.get('count')} so far"
+    elif query_dict.get('exact', True):
+        count = str(query_dict.get('count'))
+    else:
+        count = f"{query_dict.get('count')}+"
+    if query_dict.get('summed'):
+        # Merged results, see FDBController.update_merged()
+        count += " (summed over databases)"
+    return count
+
+
+def notification_id(query_dict):
+    """Id of the notification to replace with query_dict's: its own, or
+    that of the partial results it follows. Looked up when the notification
+    is sent, not before: notify-send only gives ids once it exited."""
+    notification = query_dict.get('notification')
+    if notification is None and query_dict.get('replaces') is not None:
+        notification = query_dict['replaces'].get('notification')
+    return notification
+
+
+def notification_strings(query_dict):
+    """Summary and body of the notification of query_dict's results."""
+    summary = "".join(("Found: ", count_str(query_dict), " for ",
+                       query_dict["original_query"], " in ", query_dict["db_filename"]))
+    body = "".join([
+        "".join((item, " ", bytes_2_human_readable(size), " ", str(pardir), "\n"))
+        for item, size, pardir in query_dict["found_words"]])
+    return summary, body
+
+
 class Notifier():
     """
     Abstract interface for either subprocess or python library.
@@ -442,6 +1449,16 @@ class Notifier():
             return
         return self._provider.notify(message)
 
+    def close(self):
+        """Deliver pending notifications before exiting."""
+        if hasattr(self._provider, "close"):
+            self._provider.close()
+
+    def stats(self):
+        if hasattr(self._provider, "stats"):
+            return self._provider.stats()
+        return {}
+
 
 class SPNotifier():
     """Use a subprocess to send notification (notifier-send by default)"""
@@ -456,6 +1473,18 @@ class SPNotifier():
             self.process_unavail = True
             return
         print(f"Using subprocess \"{self.process_name}\" for desktop notifications.")
+        # Whether notify-send can print the id of a notification (-p) and
+        # replace it later (-r), to update it as results come in
+        self.can_replace = path.basename(self.process_name) == "notify-send"
+        # Start processes without waiting for them
+        self.spawner = None
+        # Otherwise, run them one after the other from a thread of their
+        # own: our caller is clipster's main loop, which must not wait
+        self.runner = None
+        if config.getboolean('clipfdb', 'async_subprocesses'):
+            self.spawner = Spawner("notify", config.getint('clipfdb', 'max_processes'))
+        else:
+            self.runner = ThreadPoolExecutor(max_workers=1, thread_name_prefix="clipfdb-notify")
 
     def simple_notify(self, message, timeout):
         """Show a generic message."""
@@ -473,90 +1502,205 @@ class SPNotifier():
         else:
             category = "clipfdb_notfound"
 
-        main_message = ""
-        summary = "".join(("For ", message["original_query"],
-                           " in ", message["db_filename"]))
+        summary, main_message = notification_strings(message)
 
-        for item, size, pardir in message["found_words"]:
-            main_message += "".join([item, " ", bytes_2_human_readable(size),
-                                    " ", str(pardir), "\n"])
+        arguments = ("-c", category, summary, main_message)
+        if not self.can_replace:
+            self.call_process(arguments)
+            return
 
-        self.call_process(("-c", category, summary, main_message))
+        def replacing():
+            # Replace the notification sent earlier for the same results, if
+            # any. Evaluated only when the process starts, see Spawner.
+            notification = notification_id(message)
+            replaces = ("-r", notification) if notification else ()
+            return ("-p", *replaces, *arguments)
+
+        def done(returncode, stdout):
+            if returncode != 0:
+                # Older notify-send without -p and -r
+                self.can_replace = False
+                self.call_process(arguments)
+            elif stdout.strip().isdigit():
+                message["notification"] = stdout.strip()
+
+        self.call_process(replacing, on_done=done)
+
+    def call_process(self, arguments, on_done=None):
+        """Start the notification tool without waiting for it. arguments
+        may be a callable returning them, called when the process starts.
+        on_done(returncode, stdout) is called once it exited, its output
+        being captured for it."""
+        if self.spawner is not None:
+            if self.spawner.unavailable:
+                self.process_unavail = True
+                return
+            self.spawner.run(
+                lambda: [self.process_name,
+                         *(arguments() if callable(arguments) else arguments)],
+                on_done=on_done, capture=on_done is not None)
+            return
+        self.runner.submit(self.run_process, arguments, on_done)
 
-    def call_process(self, arguments):
+    def run_process(self, arguments, on_done):
+        """Run the notification tool and wait for it, in self.runner."""
+        if self.process_unavail:
+            return
+        capture = on_done is not None
         try:
             # cmd = ['notify-send', '-c', category, '-i', 'dialog-information', summary, found_words]
             cmd = [self.process_name]
-            cmd.extend(arguments)
-            run(cmd,
+            cmd.extend(arguments() if callable(arguments) else arguments)
+            proc = run(cmd,
                 shell=False,
                 # check=True,
-                stdout=None, stderr=None)
+                stdout=PIPE if capture else None, stderr=None,
+                text=capture)
         # except CalledProcessError as e:
         #     print(f"Process \"{self.process_name}\" error: {e}")
         #     self.process_unavail = True
         except Exception as e:
             print(f"Error from \"{self.process_name}\": {e}")
             self.process_unavail = True
+            return
+        if capture:
+            try:
+                on_done(proc.returncode, proc.stdout)
+            except Exception as e:
+                log.exception(e)
+
+    def close(self):
+        if self.spawner is not None:
+            self.spawner.close()
+        if self.runner is not None:
+            # Let queued notifications be shown
+            self.runner.shutdown(wait=True)
+
+    def stats(self):
+        if self.spawner is not None:
+            return self.spawner.stats()
+        return {}
 
 
 class LibNotifier():
-    """Use python library to send out notifications"""
+    """Use python library to send out notifications.
+    Notifications are queued to a thread running its own asyncio loop, which
+    owns the D-Bus connection: callers never wait for the notification
+    server."""
     timeout = 5000 # 5 seconds
+    # Notifications which may still be replaced
+    max_replaceable = 64
 
     def __init__(self) -> None:
-        self.server = desktop_notify.aio.Server('clipfdb')
+        self._ids = count(1)
+        self.shown = 0
+        self.coalesced = 0
+        self.failed = 0
+        self._loop = asyncio.new_event_loop()
+        self._queue = None
+        self._ready = Event()
+        self._thread = Thread(target=self._run, name="clipfdb-notify", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        self._queue = asyncio.Queue()
+        self._ready.set()
+        self._loop.run_until_complete(self._consume())
+        self._loop.run_until_complete(self._loop.shutdown_asyncgens())
+        self._loop.close()
+
+    def _put(self, item):
+        try:
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, item)
+        except RuntimeError:
+            # Loop closed on exit
+            pass
+
+    async def _consume(self):
+        import desktop_notify
+        server = desktop_notify.aio.Server('clipfdb')
+        # notification key -> Notify, shown again to replace itself
+        notifications = OrderedDict()
+        while True:
+            batch = [await self._queue.get()]
+            while not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            # Only the latest state of each notification is worth showing
+            latest = {}
+            for item in batch:
+                if item is None:
+                    break
+                if item[0] is not None:
+                    if item[0] in latest:
+                        self.coalesced += 1
+                    latest[item[0]] = item
+            for item in batch:
+                if item is None:
+                    return
+                key = item[0]
+                if key is not None and latest.get(key) is not item:
+                    continue
+                await self._show(server, notifications, *item)
+
+    async def _show(self, server, notifications, key, summary, body, timeout, category):
+        notif = notifications.get(key) if key is not None else None
+        if notif is None:
+            notif = server.Notify(
+                summary,
+                body
+                # "dialog-information" # Icon name in /usr/share/icons/
+            )
+            notif.timeout = timeout
+            if key is not None:
+                notifications[key] = notif
+                if len(notifications) > self.max_replaceable:
+                    notifications.popitem(last=False)
+        else:
+            notif.summary = summary
+            notif.body = body
+        if category is not None:
+            # We need dbus_next.Variant here because desktop-notify passes
+            # types as-is and dbus_next requires python types to be wrapped
+            from dbus_next import Variant
+            notif.set_hint('category', Variant('s', category))
+        # notif.set_location(800, 600)  # Not supported by dunst
+        try:
+            await notif.show()
+            self.shown += 1
+        except Exception as e:
+            self.failed += 1
+            log.debug(f"Exception in lib .show(): {e}")
+            log.exception(e)
 
     def simple_notify(self, message, timeout=1000):
         """Show a generic message.
         :param message str short message
         :param timeout int display duration in milliseconds"""
-
-        notify = self.server.Notify(message)
-        notify.set_timeout(timeout)
-        do_async(notify.show())
+        self._put((None, message, "", timeout, None))
 
     def notify(self, message):
         """sends dict['found_words'] to notification server."""
-        main_message = ""
-        for item, size, pardir in message['found_words']:
-            main_message += "".join(
-                [
-                    item, " ", bytes_2_human_readable(size),
-                    " ", str(pardir), "\n"
-                ]
-            )
-
         count = message['count']
-        summary = "".join(
-            (
-                "Found: ", str(count), " for ",
-                message['original_query'], " in ",
-                message['db_filename']
-            )
-        )
+        summary, main_message = notification_strings(message)
 
         log.debug(f"Sending summary {summary} message {main_message}")
-        notif = self.server.Notify(
-            summary,
-            main_message
-            # "dialog-information" # Icon name in /usr/share/icons/
-        )
-        notif.timeout = self.timeout
+        # Notifying the same message again replaces its notification when
+        # results are updated
+        key = message['notification'] = notification_id(message) or next(self._ids)
         # Set green background colour if results found, otherwise red. This is
         # configured on the notification server's side (eg. dunst)
-        # We need dbus_next.Variant here because desktop-notify passes types
-        # as-is and dbus_next requires python types to be wrapped
-        if count > 0:
-            notif.set_hint('category',  Variant('s', 'clipfdb_found'))
-        else:
-            notif.set_hint('category',  Variant('s', 'clipfdb_notfound'))
-        # notif.set_location(800, 600)  # Not supported by dunst
-        try:
-            do_async(notif.show())
-        except Exception as e:
-            log.debug(f"Exception in lib .show(): {e}")
-            log.exception(e)
+        category = 'clipfdb_found' if count > 0 else 'clipfdb_notfound'
+        self._put((key, summary, main_message, self.timeout, category))
+
+    def close(self, timeout=2):
+        """Send what is queued, then stop."""
+        self._put(None)
+        self._thread.join(timeout)
+
+    def stats(self):
+        return {"shown": self.shown, "coalesced": self.coalesced, "failed": self.failed}
 
 
 class SoundNotifier():
@@ -571,6 +1715,17 @@ class SoundNotifier():
             return
         self._provider.play(snd)
 
+    def close(self):
+        """Let the last sound play before exiting."""
+        if hasattr(self._provider, "close"):
+            self._provider.close()
+
+    def stats(self):
+        """Playback counters and latencies, if the provider keeps any."""
+        if hasattr(self._provider, "stats"):
+            return self._provider.stats()
+        return {}
+
     @property
     def success_sound(self):
         return self._provider.success_sound
@@ -608,7 +1763,12 @@ class SoundNotificationProvider():
 
 
 class SAProvider(SoundNotificationProvider):
-    """Wrapper for simpleaudio library."""
+    """Wrapper for simpleaudio library. Sounds are decoded at startup and
+    played from the thread of an AudioEngine."""
+    def __init__(self, config):
+        self.engine = AudioEngine(config.get('clipfdb', 'sound_policy'))
+        super().__init__(config)
+
     def load_sound_files(self, config):
         # Only load startup and shutdown sounds unconditionally
         # to play them regardless of config option chosen
@@ -627,11 +1787,20 @@ class SAProvider(SoundNotificationProvider):
         valid = path_or_none(path)
         if not valid:
             return None
-        return simpleaudio.WaveObject.from_wave_file(valid)
+        try:
+            return Sound(valid)
+        except Exception as e:
+            print(f"{BColors.FAIL}Failed to load {valid}: {e}{BColors.ENDC}")
+            return None
 
     def _play(self, snd):
-        played = snd.play()
-        played.wait_done()
+        self.engine.play(snd)
+
+    def close(self):
+        self.engine.close()
+
+    def stats(self):
+        return self.engine.stats()
 
 
 class SPProvider(SoundNotificationProvider):
@@ -645,6 +1814,15 @@ class SPProvider(SoundNotificationProvider):
             self.process_unavail = True
             return
         print(f"Using sound provider \"{self.process_name}\".")
+        # Start players without waiting for them. Sounds waiting for their
+        # turn are replaced by newer ones.
+        self.spawner = None
+        # Otherwise, play them one after the other from a thread of their own
+        self.runner = None
+        if config.getboolean('clipfdb', 'async_subprocesses'):
+            self.spawner = Spawner("sound", config.getint('clipfdb', 'max_processes'))
+        else:
+            self.runner = ThreadPoolExecutor(max_workers=1, thread_name_prefix="clipfdb-sound")
         super().__init__(config)
 
     def load_sound_files(self, config):
@@ -658,6 +1836,18 @@ class SPProvider(SoundNotificationProvider):
             self.failure_sound = path_or_none(config.get('clipfdb', 'failure_sound', fallback=None))
 
     def _play(self, snd_path):
+        if self.process_unavail:
+            return
+        if self.spawner is not None:
+            if self.spawner.unavailable:
+                self.process_unavail = True
+                return
+            self.spawner.run([self.process_name, snd_path], channel="sound")
+            return
+        self.runner.submit(self.run_process, snd_path)
+
+    def run_process(self, snd_path):
+        """Play snd_path and wait for the player to exit, in self.runner."""
         if self.process_unavail:
             return
         try:
@@ -674,6 +1864,17 @@ class SPProvider(SoundNotificationProvider):
             print(f"Error playing {snd_path} with \"{self.process_name}\": {e}")
             self.process_unavail = True
 
+    def close(self):
+        if self.spawner is not None:
+            self.spawner.close()
+        if self.runner is not None:
+            self.runner.shutdown(wait=True)
+
+    def stats(self):
+        if self.spawner is not None:
+            return self.spawner.stats()
+        return {}
+
 
 def find_config():
     """Attempt to find config from XDG basedir-spec paths/environment variables."""
@@ -806,22 +2007,54 @@ library or external program. [simpleaudio|paplay|...]")
     parser.add_argument('--max-results', action="store",
                         type=int, default=20,
                         help="Maximum number of results to display.")
+
+    parser.add_argument('--search-index', action="store",
+                        type=str, default=None,
+                        # choices=['no', 'trigram', 'scan'],
+                        help="In-memory index answering substring queries \
+instead of SQL. [no|trigram|scan]")
     return parser.parse_known_args()
 
 
 def init_config(args):
     """Parse config file, but override values specified from CLI args."""
-    conf_dir = args.clipfdb_config
-    if not conf_dir:
-        conf_dir, _ = find_config()
+    conf_dir, data_dir = find_config()
+    if args.clipfdb_config:
+        conf_dir = args.clipfdb_config
 
     # data_dir = path.dirname(__file__)
     config_defaults = {
         "conf_dir": conf_dir,  # clipfdb config dir
+        "data_dir": data_dir,  # clipfdb data dir (index snapshots)
         "db_filepaths": "", # list of paths to databses files
         "security2_path": "", # absolute path to security2.fdb
         "parent_directories": "yes", # retrieve parent directories of files too
         "max_results": 20, # maximum number of results to report
+        "ranking": "relevance", # order of results [relevance|alphabetical]
+        "rank_candidates": 100, # rows fetched to pick the best max_results from
+        "merge_results": "yes", # one notification for every database together
+        "async_subprocesses": "yes", # run notify-send and paplay in parallel
+        "max_processes": 2, # of each of them running at once
+        "sound_policy": "interrupt", # sound triggered while another plays [interrupt|mix|drop]
+        "query_timeout": 5, # seconds to wait for each database
+        "accurate_counts": "yes", # count every match beyond max_results
+        "stream_batch_size": 5, # rows fetched at once
+        "progress_interval_ms": 500, # notify results found so far after that
+        "fast_start": "no", # connect to databases in the background
+        "debounce_ms": 150, # wait for clipboard changes to settle before a lookup
+        "max_in_flight": 2, # lookups running at the same time
+        "cache_max_entries": 256, # cached query results, 0 disables the cache
+        "cache_max_kb": 4096, # memory used by cached query results
+        "cache_ttl": 600, # seconds before a cached query result expires
+        "query_strategy": "auto", # SQL predicate for file names [auto|like|containing|starting]
+        "search_index": "no", # in-memory index for substring queries [no|trigram|scan]
+        "index_snapshots": "yes", # keep index rows in data_dir, reuse them on restart
+        "bloom_summary": "no", # skip databases which can't match a query
+        "bloom_fp_rate": 0.02, # false positive rate these summaries are sized for
+        "record_file": "", # clipboard events appended there, see tools/replay.py
+        "slow_query_ms": 0, # log queries slower than that, 0 disables
+        "slow_query_log_kb": 1024, # size at which the slow query log is rotated
+        "cache_directories": "yes", # resolve parent directories from memory
         "notifications": "yes",
         "notification_provider": "notify-send", # prefer using notify-send instead of notify2
         "sound_notifications": "yes",
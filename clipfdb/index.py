@@ -0,0 +1,183 @@
+"""In-memory search structures built from one bulk read of a VVV FILES table."""
+from os import stat
+from array import array
+
+
+def file_signature(filepath):
+    """Return (size, mtime_ns) of the database file, None if it can't be read.
+    Used to tell whether anything built from that file is still valid."""
+    try:
+        st = stat(filepath)
+    except OSError:
+        return None
+    return (st.st_size, st.st_mtime_ns)
+
+
+class Catalog():
+    """Every (FILE_NAME, FILE_SIZE, PATH_ID) row of a database, held in
+    parallel lists. Row ids are positions in these lists."""
+
+    def __init__(self):
+        self.names = []
+        self.upper_names = []
+        self.sizes = []
+        self.path_ids = []
+
+    @classmethod
+    def from_rows(cls, rows):
+        catalog = cls()
+        for name, size, path_id in rows:
+            catalog.append(name, size, path_id)
+        return catalog
+
+    def append(self, name, size, path_id):
+        name = name or ""
+        self.names.append(name)
+        self.upper_names.append(name.upper())
+        self.sizes.append(size)
+        self.path_ids.append(path_id)
+
+    def __len__(self):
+        return len(self.names)
+
+    def row(self, row_id):
+        """Same shape as a row returned by FDB.make_select()"""
+        return [self.names[row_id], self.sizes[row_id], self.path_ids[row_id]]
+
+
+def trigrams(upper_str):
+    """Set of all 3-character substrings."""
+    return {upper_str[i:i + 3] for i in range(len(upper_str) - 2)}
+
+
+class TrigramIndex():
+    """Maps every trigram of every uppercased filename to the ids of the rows
+    containing it. A substring query only has to verify the rows listed for
+    its rarest trigram, instead of scanning the whole table."""
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.postings = {}
+        self._build()
+
+    def _build(self):
+        postings = self.postings
+        for row_id, upper_name in enumerate(self.catalog.upper_names):
+            for gram in trigrams(upper_name):
+                ids = postings.get(gram)
+                if ids is None:
+                    ids = postings[gram] = array('I')
+                ids.append(row_id)
+
+    def candidates(self, needle):
+        """Row ids which may contain needle, in ascending order."""
+        grams = trigrams(needle)
+        if not grams:
+            # Shorter than a trigram, nothing to narrow down with
+            return range(len(self.catalog))
+        smallest = None
+        for gram in grams:
+            ids = self.postings.get(gram)
+            if ids is None:
+                return ()
+            if smallest is None or len(ids) < len(smallest):
+                smallest = ids
+        return smallest
+
+    def count(self, query_str, prefix=False):
+        """Number of rows search() would return without max_results."""
+        needle = query_str.upper()
+        upper_names = self.catalog.upper_names
+        if prefix:
+            return sum(1 for row_id in self.candidates(needle)
+                       if upper_names[row_id].startswith(needle))
+        return sum(1 for row_id in self.candidates(needle)
+                   if needle in upper_names[row_id])
+
+    def search(self, query_str, max_results=0, prefix=False):
+        """Return rows whose FILE_NAME contains query_str, case insensitive.
+        Equivalent to UPPER(FILE_NAME) LIKE '%QUERY_STR%' with FIRST max_results,
+        or to STARTING WITH if prefix is set."""
+        needle = query_str.upper()
+        upper_names = self.catalog.upper_names
+        rows = []
+        for row_id in self.candidates(needle):
+            upper_name = upper_names[row_id]
+            if upper_name.startswith(needle) if prefix else needle in upper_name:
+                rows.append(self.catalog.row(row_id))
+                if max_results > 0 and len(rows) >= max_results:
+                    break
+        return rows
+
+
+class DirectoryTree():
+    """PATHS table of a database, as parent pointers and interned names.
+    Resolves PATH_ID into full paths the same way VVV's SP_GET_FULL_PATH does."""
+    ROOT = -1
+
+    def __init__(self):
+        # PATH_ID -> position in the arrays below
+        self.positions = {}
+        # Position of the parent directory, ROOT for top level ones
+        self.parents = array('q')
+        # Index of the directory name in self.names
+        self.name_ids = array('I')
+        self.names = []
+        # Whether full paths start with the separator
+        self.leading_separator = False
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build from (PATH_ID, FATHER_ID, PATH_NAME) rows."""
+        tree = cls()
+        interned = {}
+        father_ids = []
+        for path_id, father_id, name in rows:
+            name = name or ""
+            name_id = interned.get(name)
+            if name_id is None:
+                name_id = interned[name] = len(tree.names)
+                tree.names.append(name)
+            tree.positions[path_id] = len(tree.name_ids)
+            tree.name_ids.append(name_id)
+            father_ids.append(father_id)
+        # Parents may come after their children in the table
+        for father_id in father_ids:
+            tree.parents.append(tree.positions.get(father_id, cls.ROOT))
+        return tree
+
+    def __len__(self):
+        return len(self.name_ids)
+
+    def full_path(self, path_id, separator="/"):
+        """Return the full path of path_id, None if it is unknown."""
+        position = self.positions.get(path_id)
+        if position is None:
+            return None
+        parts = []
+        # Bounded walk, in case the table contains a cycle
+        for _ in range(len(self.name_ids)):
+            parts.append(self.names[self.name_ids[position]])
+            position = self.parents[position]
+            if position == self.ROOT:
+                break
+        else:
+            return None
+        full = separator.join(reversed(parts))
+        return separator + full if self.leading_separator else full
+
+    def sample(self, count):
+        """A few PATH_IDs spread over the whole table."""
+        path_ids = list(self.positions)
+        step = max(1, len(path_ids) // count)
+        return path_ids[::step][:count]
+
+    def calibrate(self, expected):
+        """Given {PATH_ID: full path} as returned by SP_GET_FULL_PATH, settle
+        on the matching path format. Return False if none matches."""
+        for leading_separator in (False, True):
+            self.leading_separator = leading_separator
+            if all(self.full_path(path_id) == full
+                   for path_id, full in expected.items()):
+                return True
+        return False
@@ -0,0 +1,173 @@
+"""CPU and memory profiling of a running daemon, started and stopped on
+demand."""
+from collections import Counter
+from os import path, makedirs
+from threading import Lock, get_ident
+from time import strftime
+import cProfile
+import gc
+import io
+import pstats
+import sys
+import tracemalloc
+
+# Allocations and functions listed in reports
+TOP = 40
+# From Python 3.12, cProfile relies on sys.monitoring: one profile sees every
+# thread, and no other one may be enabled while it is.
+PROCESS_WIDE = sys.version_info >= (3, 12)
+
+
+class Profiler():
+    """Between start() and stop(), profiles the thread which called start()
+    with cProfile, as well as every call made through call() from other
+    threads (every thread at once from Python 3.12, see PROCESS_WIDE), and
+    traces memory allocations with tracemalloc. stop() writes
+    to directory:
+        profile-<time>.pstats      for pstats, snakeviz...
+        profile-<time>.txt         functions taking the most time
+        allocations-<time>.txt     largest allocations, their growth during
+                                   profiling, and live fdb objects (cursors,
+                                   statements...) before and after
+        allocations-<time>.tracemalloc  tracemalloc.Snapshot.load() it"""
+
+    def __init__(self, directory, frames=10):
+        self.directory = directory
+        self.frames = frames
+        self.running = False
+        self._lock = Lock()
+        self._thread = None
+        self._main = None
+        self._stats = None
+        self._snapshot = None
+        self._objects = None
+        self._started = None
+        # Whether tracemalloc was started by us, rather than with
+        # PYTHONTRACEMALLOC
+        self._traced = False
+
+    def call(self, func, *args):
+        """Return func(*args), profiled if running."""
+        if not self.running or PROCESS_WIDE or get_ident() == self._thread:
+            return func(*args)
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiling tool is active, e.g. a debugger
+            return func(*args)
+        try:
+            return func(*args)
+        finally:
+            profile.disable()
+            with self._lock:
+                if self.running:
+                    self._add(profile)
+
+    def _add(self, profile):
+        profile.create_stats()
+        if not profile.stats:
+            # pstats refuses profiles which saw no call
+            return
+        if self._stats is None:
+            self._stats = pstats.Stats(profile)
+        else:
+            self._stats.add(profile)
+
+    def start(self):
+        with self._lock:
+            if self.running:
+                return
+            self._stats = None
+            self._started = strftime("%Y%m%d-%H%M%S")
+            self._objects = live_fdb_objects()
+            self._traced = not tracemalloc.is_tracing()
+            if self._traced:
+                tracemalloc.start(self.frames)
+            self._snapshot = tracemalloc.take_snapshot()
+            self._thread = get_ident()
+            self._main = cProfile.Profile()
+            try:
+                self._main.enable()
+            except ValueError:
+                # Another profiling tool is active, e.g. a debugger
+                self._main = self._snapshot = None
+                if self._traced:
+                    tracemalloc.stop()
+                raise
+            self.running = True
+
+    def stop(self):
+        """Write reports, return their paths."""
+        with self._lock:
+            if not self.running:
+                return []
+            self._main.disable()
+            self.running = False
+            self._add(self._main)
+            stats, self._stats, self._main = self._stats, None, None
+        snapshot = tracemalloc.take_snapshot()
+        if self._traced:
+            tracemalloc.stop()
+
+        makedirs(self.directory, exist_ok=True)
+        stamp = self._started
+        files = [path.join(self.directory, f"profile-{stamp}.pstats"),
+                 path.join(self.directory, f"profile-{stamp}.txt"),
+                 path.join(self.directory, f"allocations-{stamp}.txt"),
+                 path.join(self.directory, f"allocations-{stamp}.tracemalloc")]
+        if stats is None:
+            files.pop(0)
+            with open(files[0], "w", encoding="utf-8") as f:
+                f.write("No function call was profiled.\n")
+        else:
+            stats.dump_stats(files[0])
+            with open(files[1], "w", encoding="utf-8") as f:
+                stats.stream = f
+                stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(TOP)
+                stats.sort_stats(pstats.SortKey.TIME).print_stats(TOP)
+        with open(files[-2], "w", encoding="utf-8") as f:
+            f.write(allocation_report(snapshot, self._snapshot,
+                                      self._objects, live_fdb_objects()))
+        snapshot.dump(files[-1])
+        self._snapshot = None
+        return files
+
+    def toggle(self):
+        """Start, or stop and return the paths of the reports."""
+        if self.running:
+            return self.stop()
+        self.start()
+        return []
+
+
+def live_fdb_objects():
+    """Count of objects of the fdb module (connections, cursors...) by type."""
+    return Counter(type(obj).__qualname__ for obj in gc.get_objects()
+                   if type(obj).__module__.startswith("fdb"))
+
+
+def allocation_report(snapshot, previous, objects_before, objects_after):
+    # Leave out what profiling itself allocates
+    ignored = (tracemalloc.Filter(False, tracemalloc.__file__),
+               tracemalloc.Filter(False, cProfile.__file__),
+               tracemalloc.Filter(False, pstats.__file__),
+               tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+               tracemalloc.Filter(False, "<unknown>"))
+    snapshot = snapshot.filter_traces(ignored)
+    previous = previous.filter_traces(ignored)
+    out = io.StringIO()
+    total = sum(stat.size for stat in snapshot.statistics("filename"))
+    out.write(f"Traced memory: {total / 1024:.1f} KiB\n\nLargest allocations:\n")
+    for stat in snapshot.statistics("lineno")[:TOP]:
+        out.write(f"  {stat}\n")
+    out.write("\nGrowth since profiling started:\n")
+    # Sorted by absolute difference, shrinking ones included
+    growth = [stat for stat in snapshot.compare_to(previous, "lineno")
+              if stat.size_diff > 0]
+    for stat in growth[:TOP]:
+        out.write(f"  {stat}\n")
+    out.write("\nLive fdb objects (before -> after):\n")
+    for name in sorted(objects_before.keys() | objects_after.keys()):
+        out.write(f"  {name}: {objects_before[name]} -> {objects_after[name]}\n")
+    return out.getvalue()
@@ -0,0 +1,75 @@
+"""Ordering of query results, most relevant first."""
+from functools import lru_cache
+from heapq import nsmallest
+from locale import strxfrm
+import re
+
+# Relevance tiers, lower is better
+EXACT = 0      # the whole name
+EXTENSION = 1  # the whole name but its extension, e.g. holiday -> holiday.jpg
+PREFIX = 2     # start of the name
+TOKEN = 3      # a whole word of the name, e.g. holiday -> 2019 holiday_01.jpg
+SUBSTRING = 4  # anywhere else
+
+
+@lru_cache(maxsize=65536)
+def collation_key(name):
+    """strxfrm() of name, computed once for names seen again and again.
+    strxfrm() refuses NUL, which names may hold, see
+    snapshot.ESCAPED_SEPARATOR."""
+    return strxfrm((name or "").replace("\0", ""))
+
+
+def make_scorer(query_str):
+    """Return score(name) giving the relevance tier of a matching name."""
+    upper_query = query_str.upper()
+    token = re.compile(r"(?<![^\W_])" + re.escape(upper_query) + r"(?![^\W_])")
+
+    def score(name):
+        upper_name = (name or "").upper()
+        if upper_name == upper_query:
+            return EXACT
+        stem, dot, _ = upper_name.rpartition(".")
+        if dot and stem == upper_query:
+            return EXTENSION
+        if upper_name.startswith(upper_query):
+            return PREFIX
+        if token.search(upper_name):
+            return TOKEN
+        return SUBSTRING
+    return score
+
+
+def rank(result_list, query_str, max_results=0, relevance=True):
+    """Return the max_results (all if 0) best [name, size, ...] rows for
+    query_str, most relevant first, then alphabetically. Without relevance,
+    alphabetically only."""
+    if relevance:
+        score = make_scorer(query_str)
+        def key(item):
+            return (score(item[0]), collation_key(item[0]), item[1] or 0)
+    else:
+        def key(item):
+            return collation_key(item[0])
+    if 0 < max_results < len(result_list):
+        # Bounded heap rather than sorting everything
+        return nsmallest(max_results, result_list, key=key)
+    return sorted(result_list, key=key)
+
+
+def merge(parts, query_str, max_results=0, relevance=True):
+    """Combine the results of several databases, given as
+    [(db_filename, result_list)], into the best max_results rows. Files with
+    the same name and size are listed once, their third field becomes
+    "parent directories (db_filename)" for every database holding them."""
+    merged = {}
+    for db_filename, result_list in parts:
+        for name, size, pardir in result_list:
+            item = merged.get((name, size))
+            if item is None:
+                item = merged[(name, size)] = [name, size, []]
+            item[2].append(f"{pardir} ({db_filename})" if pardir else db_filename)
+    result_list = rank(list(merged.values()), query_str, max_results, relevance)
+    for item in result_list:
+        item[2] = ", ".join(item[2])
+    return result_list
@@ -0,0 +1,44 @@
+"""Record of the clipboard events seen by clipster, to replay them later with
+tools/replay.py."""
+from os import open as os_open, O_WRONLY, O_APPEND, O_CREAT, path, makedirs
+from time import time
+import json
+
+
+class ClipboardRecorder():
+    """Appends one JSON object per event to filepath:
+    {"time": seconds since the epoch, "selection": ..., "text": ...}
+    The file is only readable by its owner, it holds whatever was copied."""
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.recorded = 0
+        directory = path.dirname(filepath)
+        if directory:
+            makedirs(directory, exist_ok=True)
+        self._file = open(os_open(filepath, O_WRONLY | O_APPEND | O_CREAT, 0o600),
+                          "a", encoding="utf-8", buffering=1)
+
+    def record(self, selection, text):
+        self._file.write(json.dumps(
+            {"time": round(time(), 3), "selection": selection, "text": text},
+            ensure_ascii=False) + "\n")
+        self.recorded += 1
+
+    def close(self):
+        self._file.close()
+
+
+def read_events(filepath, selection=None):
+    """Yield (time, selection, text) of the events recorded in filepath, only
+    those of that selection if given. Lines which can't be read are skipped."""
+    with open(filepath, encoding="utf-8") as f:
+        for line in f:
+            try:
+                event = json.loads(line)
+                event_time, event_selection, text = \
+                    event["time"], event["selection"], event["text"]
+            except (ValueError, KeyError, TypeError):
+                continue
+            if selection is None or event_selection == selection:
+                yield event_time, event_selection, text
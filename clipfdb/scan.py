@@ -0,0 +1,87 @@
+"""Substring search over one contiguous buffer of uppercased file names."""
+from array import array
+from bisect import bisect_right
+
+from .snapshot import SEPARATOR, encode_upper
+
+
+class ScanIndex():
+    """Every uppercased FILE_NAME of a catalog in a single buffer, each one
+    followed by SEPARATOR, with the start of each name in `offsets`.
+    A query is a few calls to find() over the whole buffer, running in C,
+    instead of one comparison per row in Python.
+
+    Snapshots already hold such a buffer: it is searched in place, through
+    the memory mapping, without copying anything."""
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        mm = getattr(catalog, "mmap", None)
+        if mm is not None:
+            self.buffer = mm
+            self.start = catalog.upper_start
+            self.offsets = catalog.upper_offsets
+        else:
+            self.buffer, self.offsets = self._pack(catalog.upper_names)
+            self.start = 0
+        self.end = self.start + self.offsets[-1]
+
+    @staticmethod
+    def _pack(upper_names):
+        offsets = array('q', [0])
+        chunks = []
+        position = 0
+        for upper_name in upper_names:
+            encoded = encode_upper(upper_name) + SEPARATOR
+            chunks.append(encoded)
+            position += len(encoded)
+            offsets.append(position)
+        return b"".join(chunks), offsets
+
+    def row_id(self, position):
+        """Row holding the byte at position in the buffer."""
+        return bisect_right(self.offsets, position - self.start) - 1
+
+    def find(self, needle, prefix=False):
+        """Yield ids of rows whose uppercased name contains needle (bytes),
+        or starts with it, in ascending order."""
+        if not needle or SEPARATOR in needle:
+            # Every row, or none, would match
+            if not needle:
+                yield from range(len(self.catalog))
+            return
+        buffer, offsets = self.buffer, self.offsets
+        position = self.start
+        if prefix:
+            if len(self.catalog) and buffer[self.start:self.start + len(needle)] == needle:
+                yield 0
+            # Names following a separator
+            needle = SEPARATOR + needle
+            # The separator closing a row is found by that row's position
+            # plus the length of its name, hence the shift below.
+            shift = 1
+        else:
+            shift = 0
+        while True:
+            position = buffer.find(needle, position, self.end)
+            if position < 0:
+                return
+            row_id = self.row_id(position + shift)
+            yield row_id
+            # Skip to the next row
+            position = self.start + offsets[row_id + 1] - shift
+
+    def search(self, query_str, max_results=0, prefix=False):
+        """Same as index.TrigramIndex.search()"""
+        needle = query_str.upper().encode("utf-8", errors="replace")
+        rows = []
+        for row_id in self.find(needle, prefix):
+            rows.append(self.catalog.row(row_id))
+            if max_results > 0 and len(rows) >= max_results:
+                break
+        return rows
+
+    def count(self, query_str, prefix=False):
+        """Number of rows search() would return without max_results."""
+        needle = query_str.upper().encode("utf-8", errors="replace")
+        return sum(1 for _ in self.find(needle, prefix))
@@ -0,0 +1,55 @@
+"""Log of the database queries slower than a threshold, one JSON object per
+line, see tools/slowlog_report.py."""
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from os import path, makedirs
+import json
+import logging
+
+
+class SlowQueryLog():
+    """Writes entries to filepath, rotated once it reaches max_bytes, keeping
+    `backups` previous files (filepath.1 being the latest)."""
+
+    def __init__(self, filepath, threshold, max_bytes, backups=3):
+        self.filepath = filepath
+        # Seconds
+        self.threshold = threshold
+        self.logged = 0
+        makedirs(path.dirname(filepath), exist_ok=True)
+        self._logger = logging.getLogger(f"clipfdb.slowlog.{filepath}")
+        self._logger.propagate = False
+        self._logger.setLevel(logging.INFO)
+        self._handler = RotatingFileHandler(
+            filepath, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+        self._handler.setFormatter(logging.Formatter("%(message)s"))
+        self._logger.addHandler(self._handler)
+
+    def is_slow(self, seconds):
+        return seconds >= self.threshold
+
+    def write(self, entry):
+        """Log entry, a dict, with the current time added."""
+        entry = {"time": datetime.now().isoformat(timespec="milliseconds"), **entry}
+        self._logger.info(json.dumps(entry, ensure_ascii=False, default=str))
+        self.logged += 1
+
+    def close(self):
+        self._logger.removeHandler(self._handler)
+        self._handler.close()
+
+
+def read_entries(filepath, backups=3):
+    """Yield the entries of filepath and its rotated files, oldest first.
+    Lines which can't be read are skipped."""
+    for suffix in [f".{i}" for i in range(backups, 0, -1)] + [""]:
+        try:
+            f = open(filepath + suffix, encoding="utf-8")
+        except FileNotFoundError:
+            continue
+        with f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
@@ -0,0 +1,190 @@
+"""On-disk snapshots of a database's FILES table, opened with mmap.
+
+Layout (native byte order):
+    header          see HEADER below, then the database filepath (utf-8)
+    name_offsets    int64[count + 1], start of each name in the names blob
+    upper_offsets   int64[count + 1], start of each name in the upper blob
+    sizes           int64[count], FILE_SIZE, -1 for NULL
+    path_ids        int64[count], PATH_ID, -1 for NULL
+    names blob      utf-8 FILE_NAME values, each followed by SEPARATOR
+    upper blob      same as above, uppercased, with SEPARATOR bytes inside
+                    names replaced, see encode_upper()
+
+Every array starts on an 8 byte boundary. The file is only valid for the
+database file of the same size and mtime as recorded in the header.
+"""
+from os import path, replace, makedirs, getpid
+from array import array
+import mmap
+import struct
+
+MAGIC = b"CLIPFDB\0"
+VERSION = 2
+# magic, version, filepath length, db size, db mtime_ns, row count,
+# names blob length, upper blob length
+HEADER = struct.Struct("=8sIIqqqqq")
+SEPARATOR = b"\0"
+# Stands for SEPARATOR inside names. Never found in utf-8, so no query
+# matches across it.
+ESCAPED_SEPARATOR = b"\xff"
+NULL = -1
+
+
+def encode_upper(name):
+    """Uppercased, utf-8 encoded name, without SEPARATOR bytes: the upper
+    blob is searched as a whole, names are told apart by them."""
+    return name.upper().encode("utf-8", errors="replace").replace(
+        SEPARATOR, ESCAPED_SEPARATOR)
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+
+class BlobList():
+    """Read-only sequence of the strings stored in a blob, decoded on access."""
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        # Skip the separator at the end
+        return str(self.blob[self.offsets[i]:self.offsets[i + 1] - 1], "utf-8",
+                   errors="replace")
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class _NullableList():
+    """int64 array view where NULL stands for None."""
+
+    def __init__(self, values):
+        self.values = values
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, i):
+        value = self.values[i]
+        return None if value == NULL else value
+
+
+class Snapshot():
+    """Memory-mapped catalog, same interface as index.Catalog. Pages are
+    shared between every process that opens the same snapshot."""
+
+    def __init__(self, filepath, mm):
+        self.filepath = filepath
+        self._mmap = mm
+        self._buf = buf = memoryview(mm)
+        magic, version, path_len, db_size, db_mtime, count, names_len, upper_len = \
+            HEADER.unpack_from(buf)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{filepath} is not a clipfdb snapshot")
+        self.signature = (db_size, db_mtime)
+        pos = HEADER.size
+        self.db_filepath = str(buf[pos:pos + path_len], "utf-8")
+        pos = _align(pos + path_len)
+
+        def take(length, fmt=None):
+            nonlocal pos
+            view = buf[pos:pos + length]
+            pos = _align(pos + length)
+            return view.cast(fmt) if fmt else view
+
+        self.name_offsets = take((count + 1) * 8, "q")
+        self.upper_offsets = take((count + 1) * 8, "q")
+        self._sizes = take(count * 8, "q")
+        self._path_ids = take(count * 8, "q")
+        self.names_blob = take(names_len)
+        # Position of the upper blob in the mapping, to search it in place
+        self.upper_start = pos
+        self.upper_blob = take(upper_len)
+
+        self.names = BlobList(self.names_blob, self.name_offsets)
+        self.upper_names = BlobList(self.upper_blob, self.upper_offsets)
+        self.sizes = _NullableList(self._sizes)
+        self.path_ids = _NullableList(self._path_ids)
+
+    @classmethod
+    def open(cls, filepath, db_filepath, signature=None):
+        """Return the snapshot at filepath if it was made from db_filepath
+        with the given signature (if any), None otherwise."""
+        try:
+            with open(filepath, "rb") as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        try:
+            snapshot = cls(filepath, mm)
+        except (ValueError, struct.error, TypeError):
+            return None
+        if snapshot.db_filepath != db_filepath \
+        or (signature is not None and snapshot.signature != signature):
+            snapshot.close()
+            return None
+        return snapshot
+
+    @property
+    def mmap(self):
+        return self._mmap
+
+    def __len__(self):
+        return len(self.name_offsets) - 1
+
+    def row(self, row_id):
+        return [self.names[row_id], self.sizes[row_id], self.path_ids[row_id]]
+
+    def close(self):
+        for view in (self.name_offsets, self.upper_offsets, self._sizes,
+                     self._path_ids, self.names_blob, self.upper_blob, self._buf):
+            view.release()
+        self._mmap.close()
+
+
+def write_snapshot(filepath, db_filepath, rows, signature=(0, 0)):
+    """Write (FILE_NAME, FILE_SIZE, PATH_ID) rows to a new snapshot.
+    The file is replaced atomically so readers never see a partial one."""
+    name_offsets = array("q", [0])
+    upper_offsets = array("q", [0])
+    sizes = array("q")
+    path_ids = array("q")
+    names_blob = bytearray()
+    upper_blob = bytearray()
+    for name, size, path_id in rows:
+        name = name or ""
+        names_blob += name.encode("utf-8", errors="replace") + SEPARATOR
+        upper_blob += encode_upper(name) + SEPARATOR
+        name_offsets.append(len(names_blob))
+        upper_offsets.append(len(upper_blob))
+        sizes.append(NULL if size is None else size)
+        path_ids.append(NULL if path_id is None else path_id)
+
+    encoded_path = db_filepath.encode("utf-8")
+    header = HEADER.pack(MAGIC, VERSION, len(encoded_path), signature[0],
+                         signature[1], len(sizes), len(names_blob), len(upper_blob))
+
+    makedirs(path.dirname(filepath), exist_ok=True)
+    tmp_path = f"{filepath}.{getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        for chunk in (header + encoded_path, name_offsets, upper_offsets,
+                      sizes, path_ids, names_blob, upper_blob):
+            f.write(chunk)
+            f.write(b"\0" * (_align(f.tell()) - f.tell()))
+    replace(tmp_path, filepath)
+
+
+def restamp(filepath, signature):
+    """Record a new database signature in an existing snapshot, once we know
+    the database itself did not change (our own transactions touch it)."""
+    with open(filepath, "r+b") as f:
+        header = list(HEADER.unpack(f.read(HEADER.size)))
+        header[3], header[4] = signature
+        f.seek(0)
+        f.write(HEADER.pack(*header))
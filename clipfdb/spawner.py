@@ -0,0 +1,117 @@
+"""Run external programs (notify-send, paplay...) without waiting for them."""
+from collections import deque
+from subprocess import Popen, PIPE
+from threading import Thread, Condition
+import logging
+log = logging.getLogger("clipster")
+
+
+class Spawner():
+    """Starts commands from a thread of its own, at most max_running at once,
+    and reaps them when they exit. Callers never wait.
+
+    Commands queued on the same channel replace each other while waiting for
+    their turn: only the latest one runs. on_done(returncode, stdout) is
+    called from that thread once a command exited, stdout being None unless
+    capture is set. Commands capturing their output are waited for before
+    starting the next one, so that on_done can be relied upon by it."""
+
+    def __init__(self, name, max_running=2):
+        self.name = name
+        self.max_running = max(1, max_running)
+        # Set when the program can't be started at all
+        self.unavailable = False
+        self.spawned = 0
+        self.dropped = 0
+        self.failed = 0
+        self._queue = deque()
+        self._running = []
+        self._closed = False
+        self._cond = Condition()
+        self._thread = Thread(target=self._run, name=f"clipfdb-{name}", daemon=True)
+        self._thread.start()
+
+    def run(self, arguments, on_done=None, capture=False, channel=None):
+        """Queue a command. arguments may be a callable returning them, to
+        build them only when the command starts."""
+        with self._cond:
+            if self._closed or self.unavailable:
+                return
+            if channel is not None:
+                stale = [r for r in self._queue if r[3] == channel]
+                for request in stale:
+                    self._queue.remove(request)
+                self.dropped += len(stale)
+            self._queue.append((arguments, on_done, capture, channel))
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    # Wake up now and then to reap what exited meanwhile
+                    self._cond.wait(0.5 if self._running else None)
+                    self._reap()
+                if not self._queue:
+                    break
+                request = self._queue.popleft()
+            while not self._reap() and len(self._running) >= self.max_running:
+                self._running[0][0].wait()
+            self._start(*request)
+        for proc, on_done in self._running:
+            self._done(proc, on_done, proc.wait())
+
+    def _reap(self):
+        """Handle commands which exited. Returns whether any did."""
+        exited = [(proc, on_done) for proc, on_done in self._running
+                  if proc.poll() is not None]
+        for proc, on_done in exited:
+            self._running.remove((proc, on_done))
+            self._done(proc, on_done, proc.returncode)
+        return bool(exited) and len(self._running) < self.max_running
+
+    def _start(self, arguments, on_done, capture, channel):
+        if callable(arguments):
+            arguments = arguments()
+        try:
+            proc = Popen(arguments, shell=False, stdout=PIPE if capture else None,
+                         stderr=None, text=capture)
+        except Exception as e:
+            print(f"Error from \"{arguments[0]}\": {e}")
+            self.unavailable = True
+            return
+        self.spawned += 1
+        if capture:
+            stdout, _ = proc.communicate()
+            self._done(proc, on_done, proc.returncode, stdout)
+        else:
+            self._running.append((proc, on_done))
+
+    def _done(self, proc, on_done, returncode, stdout=None):
+        if returncode != 0:
+            self.failed += 1
+        if on_done is None:
+            if returncode != 0:
+                print(f"\"{proc.args[0]}\" exited with status {returncode}.")
+            return
+        try:
+            on_done(returncode, stdout)
+        except Exception as e:
+            log.exception(e)
+
+    def close(self, timeout=2):
+        """Start what is queued, wait for everything to exit."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "spawned": self.spawned,
+                "running": len(self._running),
+                "queued": len(self._queue),
+                "dropped": self.dropped,
+                "failed": self.failed,
+            }
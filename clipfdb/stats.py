@@ -0,0 +1,87 @@
+"""Latency of each stage of a lookup, per database."""
+from collections import deque
+from contextlib import contextmanager
+from threading import Lock
+from time import perf_counter
+
+# Name used for stages which don't belong to a single database
+ALL = "*"
+
+
+class Histogram():
+    """Count, errors and the latest `size` durations of one stage."""
+
+    def __init__(self, size):
+        self.samples = deque(maxlen=size)
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+
+    def add(self, seconds, error):
+        self.samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+        if error:
+            self.errors += 1
+
+    def summary(self):
+        samples = sorted(self.samples)
+
+        def percentile(p):
+            if not samples:
+                return None
+            return round(samples[min(len(samples) - 1, int(len(samples) * p))] * 1000, 3)
+
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "mean_ms": round(self.total / self.count * 1000, 3) if self.count else None,
+            "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95),
+            "p99_ms": percentile(0.99),
+            "max_ms": percentile(1),
+        }
+
+
+class LatencyStats():
+    """Histograms of stage durations, keyed by database name then stage.
+    Percentiles are computed over the latest `size` samples of each."""
+
+    def __init__(self, size=1024):
+        self.size = size
+        self._histograms = {}
+        self._lock = Lock()
+
+    def record(self, db_name, stage, seconds, error=False):
+        key = (db_name, stage)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.size)
+            histogram.add(seconds, error)
+
+    @contextmanager
+    def span(self, db_name, stage):
+        """Record how long the body of the with statement takes. Exceptions
+        count as errors."""
+        start = perf_counter()
+        error = True
+        try:
+            yield
+            error = False
+        finally:
+            self.record(db_name, stage, perf_counter() - start, error)
+
+    def snapshot(self):
+        """{db_name: {stage: summary}}"""
+        with self._lock:
+            items = [(key, histogram.summary())
+                     for key, histogram in self._histograms.items()]
+        result = {}
+        for (db_name, stage), summary in sorted(items):
+            result.setdefault(db_name, {})[stage] = summary
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
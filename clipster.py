@@ -101,6 +101,10 @@ class Client(object):
             self.client_action = "DELETE"
         elif args.erase_entire_board:
             self.client_action = "ERASE"
+        elif args.stats:
+            self.client_action = "STATS"
+        elif args.profile:
+            self.client_action = "PROFILE"
         elif args.output or args.search is not None:
             self.client_action = "BOARD"
         logging.debug("client_action: %s", self.client_action)
@@ -148,6 +152,37 @@ class Client(object):
         """Send a signal and count to daemon socket requesting items from history."""
 
         logging.debug("Connecting to server to query history.")
+        # Send message 'header'
+        message = "{0}:{1}:{2}".format(self.client_action,
+                                       self.config.get('clipster',
+                                                       'default_selection'),
+                                       self.args.number)
+        if self.args.search:
+            message = "{0}:{1}".format(message, self.args.search)
+        data = self.request(message)
+        if data:
+            # data is a list of 1 or more parts of a json string.
+            # Reassemble this, then join with delimiter
+            json_data = json.loads(''.join(data))
+            if self.args.position is not None:
+                json_data = json_data[self.args.position]
+            return self.args.delim.join(json_data)
+
+    def stats(self):
+        """Request latency statistics of clipfdb lookups from daemon socket,
+        or toggle profiling with the PROFILE action."""
+
+        logging.debug("Connecting to server to query statistics.")
+        data = self.request("{0}:{1}:0".format(self.client_action,
+                                               self.config.get('clipster',
+                                                               'default_selection')))
+        if not data:
+            raise ClipsterError("No reply received from daemon.")
+        return json.dumps(json.loads(''.join(data)), indent=2) + '\n'
+
+    def request(self, message):
+        """Send message to daemon socket, return the reply as a list of parts."""
+
         with closing(socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)) as sock:
             # pylint doesn't like contextlib.closing (https://github.com/PyCQA/astroid/issues/347)
             # pylint:disable=no-member
@@ -156,13 +191,6 @@ class Client(object):
             except socket.error:
                 raise ClipsterError("Error connecting to socket. Is daemon running?")
             logging.debug("Sending request to server.")
-            # Send message 'header'
-            message = "{0}:{1}:{2}".format(self.client_action,
-                                           self.config.get('clipster',
-                                                           'default_selection'),
-                                           self.args.number)
-            if self.args.search:
-                message = "{0}:{1}".format(message, self.args.search)
             sock.sendall(message.encode('utf-8'))
 
             sock.shutdown(socket.SHUT_WR)
@@ -176,13 +204,7 @@ class Client(object):
                     data.append(safe_decode(recv))
                 except socket.error:
                     break
-        if data:
-            # data is a list of 1 or more parts of a json string.
-            # Reassemble this, then join with delimiter
-            json_data = json.loads(''.join(data))
-            if self.args.position is not None:
-                json_data = json_data[self.args.position]
-            return self.args.delim.join(json_data)
+        return data
 
 
 class Daemon(object):
@@ -194,7 +216,9 @@ class Daemon(object):
         """Set up clipboard objects and history dict."""
 
         self.config = config
-        self.fdb_handle = fdb_query.FDBController()
+        # Lookups run in a background thread, have their results reported
+        # from the main loop.
+        self.fdb_handle = fdb_query.FDBController(dispatch=GLib.idle_add)
         self.patterns = []
         self.ignore_patterns = []
         self.window = self.p_id = self.c_id = self.sock = None
@@ -492,8 +516,9 @@ class Daemon(object):
         text = board.wait_for_text()
         if text:
             logging.debug("Selection is text.")
+            self.fdb_handle.record(selection, text)
             if selection == "CLIPBOARD":
-                self.fdb_handle.query(text)
+                self.fdb_handle.submit(text)
 
             self.update_history(selection, text)
             # If no text received, either the selection was an empty string,
@@ -607,6 +632,18 @@ class Daemon(object):
             self.boards[board] = []
             self.update_board(board)
             self.update_history_file = True
+        elif sig in ("STATS", "PROFILE"):
+            # Latency of each stage of clipfdb lookups and related counters,
+            # or start/stop profiling them
+            if sig == "STATS":
+                result = self.fdb_handle.stats()
+            else:
+                result = self.fdb_handle.profile_toggle()
+            try:
+                conn.sendall(json.dumps(result).encode('utf-8'))
+            except (socket.error, OSError) as exc:
+                logging.error("Socket error %s", exc)
+                logging.debug("Exception:", exc_info=True)
 
     def read_patt_file(self, name):
         """Get a series of regexes (one per line) from a file and return as a list."""
@@ -717,6 +754,7 @@ class Daemon(object):
         GLib.unix_signal_add(GLib.PRIORITY_HIGH, signal.SIGTERM, self.exit)
         GLib.unix_signal_add(GLib.PRIORITY_HIGH, signal.SIGHUP, self.exit)
         signal.signal(signal.SIGUSR1, self.fdb_handle.active_toggle)
+        signal.signal(signal.SIGUSR2, self.fdb_handle.profile_toggle)
 
         # Timeout for flushing history to disk
         # Do nothing if timeout is 0, or write_on_change is set in config
@@ -780,6 +818,10 @@ def parse_args():
                            help="Delete from clipboard. Deletes matching text, or if no argument given, deletes last item.")
     actiongrp.add_argument('--erase-entire-board', action="store_true",
                            help="Delete all items from the clipboard.")
+    actiongrp.add_argument('--stats', action="store_true",
+                           help="Output latency statistics of clipfdb lookups as JSON.")
+    actiongrp.add_argument('--profile', action="store_true",
+                           help="Start profiling clipfdb, or stop and write reports (same as SIGUSR2).")
     parser.add_argument('-N', '--position', action="store", type=int,
                         help="Return an entry from a specific indexed position. Defaults to -1 (last entry).")
     parser.add_argument('-n', '--number', action="store", type=int, default=1,
@@ -900,6 +942,8 @@ def main():
                 # python2 needs unicode explicitly encoded
                 output = output.encode('utf-8')
             print(output, end='')
+        elif args.stats or args.profile:
+            print(client.stats(), end='')
         else:
             # Read from stdin and send to server
             client.update()
@@ -28,6 +28,10 @@ while (( "$#" )); do
       TOGGLE=1
       shift
       ;;
+    --profile) # start or stop profiling the running daemon
+      PROFILE=1
+      shift
+      ;;
     *) # preserve positional arguments
       PARAMS+=("$1")
       PARAM_COUNT=$((PARAM_COUNT+1))
@@ -90,6 +94,10 @@ toggle() {
     kill -0 "$1" && kill -USR1 "$1";
 }
 
+profile() {
+    kill -0 "$1" && kill -USR2 "$1";
+}
+
 stop() {
     # `kill -0 pid` returns successfully if the pid is running, but does not actually kill it.
     kill -0 "$1" && kill "$1"
@@ -106,6 +114,8 @@ if [[ "${runningvar}" == "running" ]]; then
     # echo "$script_full_path was running with PID ${PID}"
     if [[ ! -z ${TOGGLE} ]]; then
         toggle "${PID}"
+    elif [[ ! -z ${PROFILE} ]]; then
+        profile "${PID}"
     else
         stop "${PID}"
     fi
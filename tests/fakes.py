@@ -0,0 +1,102 @@
+"""Stand-ins for fdb connections, writing to the database file as Firebird
+does when transactions run."""
+import os
+from argparse import Namespace
+from contextlib import redirect_stdout
+from io import StringIO
+
+from clipfdb.fdb_query import FDB, init_config
+
+ROWS = [("holiday.jpg", 1024, 1), ("IMG_2019.png", 2048, 2), ("notes.txt", 10, 1)]
+
+
+class FakeCursor():
+
+    def __init__(self, con):
+        self.con = con
+        self.rows = []
+
+    def execute(self, sql, params=None):
+        # Firebird writes to the database file when a transaction starts
+        self.con.touch()
+        if self.con.during_query is not None:
+            self.con.during_query()
+        if "WHERE" in sql:
+            needle = params[0].strip("%").upper()
+            self.rows = [row for row in ROWS if needle in row[0].upper()]
+            if sql.startswith("select count(*)"):
+                self.rows = [(len(self.rows),)]
+        elif sql.startswith("select FILE_NAME"):
+            self.con.bulk_reads += 1
+            self.rows = list(ROWS)
+        elif "SP_GET_FULL_PATH" in sql:
+            self.con.path_lookups.append(params[0])
+            self.rows = [(f"/photos/{params[0]}",)]
+        else:
+            self.rows = []
+        return self
+
+    def prep(self, sql):
+        return sql
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchmany(self, size):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+    def fetchall(self):
+        return self.fetchmany(len(self.rows))
+
+    def close(self):
+        pass
+
+
+class FakeConnection():
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.bulk_reads = 0
+        # PATH_ID resolved through SP_GET_FULL_PATH, in order
+        self.path_lookups = []
+        # Called while queries run, e.g. to write to the file as VVV would
+        self.during_query = None
+
+    def touch(self):
+        mtime = os.stat(self.filepath).st_mtime_ns + 1_000_000
+        os.utime(self.filepath, ns=(mtime, mtime))
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.touch()
+
+    def close(self):
+        pass
+
+
+class FakeFDB(FDB):
+
+    def open_connection(self):
+        self.fake_con = FakeConnection(self.db_filepath)
+        return self.fake_con
+
+
+def make_config(directory, **options):
+    """Default config keeping its data in directory, with these options."""
+    with redirect_stdout(StringIO()):
+        config = init_config(Namespace(clipfdb_config=directory))
+    config.set('clipfdb', "data_dir", directory)
+    for option, value in options.items():
+        config.set('clipfdb', option, value)
+    return config
+
+
+def make_database(directory):
+    """Path of a new database file in directory."""
+    filepath = os.path.join(directory, "test.vvv")
+    with open(filepath, "wb") as f:
+        f.write(b"\0" * 4096)
+    return filepath
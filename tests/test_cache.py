@@ -0,0 +1,20 @@
+"""Cached results are shared by the queries running the same SQL only."""
+import unittest
+
+from clipfdb.cache import QueryCache
+
+
+class CacheKeyTest(unittest.TestCase):
+
+    def test_case_insensitive(self):
+        self.assertEqual(QueryCache.make_key("a.vvv", "holiday", 20, True),
+                         QueryCache.make_key("a.vvv", "HOLIDAY", 20, True))
+
+    def test_spaces_kept(self):
+        # "%HOLIDAY %" and "%HOLIDAY%" don't match the same names
+        self.assertNotEqual(QueryCache.make_key("a.vvv", "holiday ", 20, True),
+                            QueryCache.make_key("a.vvv", "holiday", 20, True))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,26 @@
+"""A controller with every output turned off disables itself, but still
+answers what clipster and the tools ask of it."""
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+
+from clipfdb.fdb_query import FDBController
+
+from fakes import make_config
+
+
+class DisabledControllerTest(unittest.TestCase):
+
+    def test_readiness(self):
+        with tempfile.TemporaryDirectory() as directory:
+            config = make_config(directory, notifications="no",
+                                 sound_notifications="no", terminal_output="no")
+            with redirect_stdout(StringIO()):
+                controller = FDBController(config=config)
+        self.assertTrue(controller.is_disabled)
+        self.assertEqual(controller.readiness(), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
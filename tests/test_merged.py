@@ -0,0 +1,61 @@
+"""Partial results of merged lookups include the databases done querying,
+and stop being notified once the final results were."""
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+from types import SimpleNamespace
+
+from clipfdb.fdb_query import FDBController, count_str
+
+from fakes import make_config
+
+
+class StubNotifier():
+
+    def __init__(self):
+        self.sent = []
+        self.success_sound = self.failure_sound = None
+
+    def notify(self, message):
+        self.sent.append((count_str(message), [row[0] for row in message['found_words']]))
+
+    def play(self, sound):
+        pass
+
+
+class MergedProgressTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        config = make_config(self.directory.name, notifications="no", terminal_output="yes",
+                             sound_notifications="no", merge_results="yes")
+        with redirect_stdout(StringIO()):
+            self.controller = FDBController(config=config)
+        self.controller.notifier = self.controller.snd_notifier = StubNotifier()
+        self.controller.wants_terminal_output = False
+        self.merged = self.controller.make_merged_dict("holiday")
+        self.fast = SimpleNamespace(db_filename="fast")
+        self.slow = SimpleNamespace(db_filename="slow")
+        # Done querying, not reported yet
+        self.finished = {'db_filename': "fast", 'original_query': "holiday",
+                         'found_words': [["holiday.jpg", 1024, "photos"]],
+                         'count': 1, 'exact': True}
+        self.merged['finished']["fast"] = self.finished
+
+    def test_progress_includes_finished(self):
+        self.controller.report_merged_progress(
+            self.merged, self.slow, [["holiday.mp4", 2048, "videos"]], 1)
+        self.assertEqual(self.controller.notifier.sent,
+                         [("2 so far (summed over databases)", ["holiday.jpg", "holiday.mp4"])])
+
+    def test_no_progress_after_final_report(self):
+        self.controller.report_merged(self.merged, [self.finished])
+        self.controller.report_merged_progress(
+            self.merged, self.slow, [["holiday.mp4", 2048, "videos"]], 1)
+        self.assertEqual(self.controller.notifier.sent, [("1", ["holiday.jpg"])])
+
+
+if __name__ == "__main__":
+    unittest.main()
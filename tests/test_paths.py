@@ -0,0 +1,43 @@
+"""Parent directories are only resolved for the rows kept once ranked."""
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+
+from fakes import FakeFDB, make_config, make_database
+
+
+class ResolvePathsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        config = make_config(self.directory.name, search_index="no",
+                             bloom_summary="no", parent_directories="yes",
+                             cache_directories="no", max_results="1",
+                             ranking="relevance", rank_candidates="100")
+        self.db = FakeFDB(make_database(self.directory.name), "", "", config, "test")
+        with redirect_stdout(StringIO()):
+            self.db.init_connection()
+            self.db.refresh()
+
+    def test_only_kept_rows_resolved(self):
+        # holiday.jpg and IMG_2019.png match, the latter starts with "img"
+        result_list, found_count = self.db.query("img")
+        self.assertEqual(found_count, 1)
+        result_list, found_count = self.db.query("g")
+        self.assertEqual(found_count, 2)
+        self.assertEqual(len(result_list), 1)
+        name, _, parent = result_list[0]
+        path_id = {"holiday.jpg": 1, "IMG_2019.png": 2}[name]
+        self.assertEqual(parent, f"photos/{path_id}")
+        self.assertEqual(self.db.fake_con.path_lookups, [2, path_id])
+
+    def test_stream_rows_bare(self):
+        rows = [row for batch, _ in self.db.stream("g") for row in batch]
+        self.assertEqual(sorted(rows), [["IMG_2019.png", 2048, 2], ["holiday.jpg", 1024, 1]])
+        self.assertEqual(self.db.fake_con.path_lookups, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
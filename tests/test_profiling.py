@@ -0,0 +1,77 @@
+"""Profiler.call() works while start() profiles, also when cProfile allows a
+single active profile, as it does from Python 3.12."""
+import cProfile
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from clipfdb import profiling
+from clipfdb.profiling import Profiler
+
+
+class ExclusiveProfile(cProfile.Profile):
+    """Refuses to be enabled while another one is, like sys.monitoring."""
+    active = None
+
+    def enable(self, *args, **kwargs):
+        if ExclusiveProfile.active not in (None, self):
+            raise ValueError("Another profiling tool is already active")
+        ExclusiveProfile.active = self
+        super().enable(*args, **kwargs)
+
+    def disable(self):
+        super().disable()
+        if ExclusiveProfile.active is self:
+            ExclusiveProfile.active = None
+
+
+def lookup(text):
+    return sorted(text.upper())
+
+
+class ProfilerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.profiler = Profiler(self.directory.name)
+
+    def profile_calls(self):
+        self.profiler.start()
+        try:
+            self.assertEqual(self.profiler.call(lookup, "ba"), ["A", "B"])
+            with ThreadPoolExecutor(max_workers=1) as worker:
+                future = worker.submit(self.profiler.call, lookup, "dc")
+                self.assertEqual(future.result(), ["C", "D"])
+        finally:
+            files = self.profiler.stop()
+        self.assertFalse(self.profiler.running)
+        for filepath in files:
+            self.assertTrue(os.path.getsize(filepath) > 0, filepath)
+        return files
+
+    def test_call_while_started(self):
+        self.assertEqual(len(self.profile_calls()), 4)
+
+    def test_call_with_single_profile_allowed(self):
+        with mock.patch.object(profiling.cProfile, "Profile", ExclusiveProfile):
+            self.profile_calls()
+        self.assertIsNone(ExclusiveProfile.active)
+
+    def test_start_with_another_profile_active(self):
+        other = ExclusiveProfile()
+        other.enable()
+        try:
+            with mock.patch.object(profiling.cProfile, "Profile", ExclusiveProfile):
+                with self.assertRaises(ValueError):
+                    self.profiler.start()
+                self.assertFalse(self.profiler.running)
+                self.assertEqual(self.profiler.call(lookup, "ba"), ["A", "B"])
+        finally:
+            other.disable()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+"""Snapshots and Bloom summaries saved on exit are reused on the next start,
+although our own transactions touch the database file."""
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+
+from clipfdb.snapshot import Snapshot
+
+from fakes import FakeFDB, make_config, make_database
+
+
+class RestartTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.db_filepath = make_database(self.directory.name)
+        self.config = make_config(self.directory.name, search_index="scan",
+                                  index_snapshots="yes", bloom_summary="yes",
+                                  parent_directories="no")
+
+    def start(self):
+        db = FakeFDB(self.db_filepath, "", "", self.config, "test")
+        with redirect_stdout(StringIO()):
+            db.init_connection()
+            db.refresh()
+        return db
+
+    def test_snapshot_and_summary_reused(self):
+        db = self.start()
+        self.assertEqual(db.fake_con.bulk_reads, 1)
+        self.assertEqual(db.index.search("holiday"), [["holiday.jpg", 1024, 1]])
+        db.exit()
+        db.index.catalog.close()
+
+        db = self.start()
+        self.assertEqual(db.fake_con.bulk_reads, 0)
+        self.assertIsInstance(db.index.catalog, Snapshot)
+        self.assertIsNotNone(db.bloom)
+        self.assertTrue(db.is_unchanged())
+        self.assertEqual(db.index.search("holiday"), [["holiday.jpg", 1024, 1]])
+        db.index.catalog.close()
+
+    def test_changed_database_read_again(self):
+        db = self.start()
+        db.exit()
+        db.index.catalog.close()
+        # Changed by VVV while we were not running
+        with open(self.db_filepath, "ab") as f:
+            f.write(b"\0" * 4096)
+
+        db = self.start()
+        self.assertEqual(db.fake_con.bulk_reads, 1)
+        db.index.catalog.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
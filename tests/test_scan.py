@@ -0,0 +1,48 @@
+"""ScanIndex results match a row by row scan, names holding the separator
+byte included."""
+import os
+import tempfile
+import unittest
+
+from clipfdb.index import Catalog
+from clipfdb.scan import ScanIndex
+from clipfdb.snapshot import Snapshot, write_snapshot
+
+ROWS = [("holiday.jpg", 1, 1), ("a\0holiday.jpg", 2, 1), ("Holiday\0", 3, 2),
+        ("x\0", 4, 2), ("\0y", 5, 3), ("notes.txt", 6, 3)]
+
+
+def expected(query_str, prefix=False):
+    needle = query_str.upper()
+    return [[name, size, path_id] for name, size, path_id in ROWS
+            if (name.upper().startswith(needle) if prefix else needle in name.upper())]
+
+
+class ScanIndexTest(unittest.TestCase):
+
+    def check(self, index):
+        for query_str in ("holiday", "HOLIDAY.JPG", "y", "x", "notes", "jpg"):
+            for prefix in (False, True):
+                self.assertEqual(index.search(query_str, prefix=prefix),
+                                 expected(query_str, prefix), (query_str, prefix))
+                self.assertEqual(index.count(query_str, prefix=prefix),
+                                 len(expected(query_str, prefix)), (query_str, prefix))
+
+    def test_catalog(self):
+        self.check(ScanIndex(Catalog.from_rows(ROWS)))
+
+    def test_snapshot(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filepath = os.path.join(directory, "test.snapshot")
+            write_snapshot(filepath, "test.vvv", ROWS)
+            snapshot = Snapshot.open(filepath, "test.vvv")
+            try:
+                self.assertEqual([snapshot.row(i) for i in range(len(snapshot))],
+                                 [list(row) for row in ROWS])
+                self.check(ScanIndex(snapshot))
+            finally:
+                snapshot.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
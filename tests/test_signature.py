@@ -0,0 +1,69 @@
+"""Our own queries touch the database file without making our in-memory
+structures stale, changes made by others while they run still do."""
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+
+from fakes import FakeFDB, make_config, make_database
+
+
+class SignatureTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.db_filepath = make_database(self.directory.name)
+        config = make_config(self.directory.name, search_index="no",
+                             parent_directories="no", bloom_summary="no")
+        self.db = FakeFDB(self.db_filepath, "", "", config, "test")
+        with redirect_stdout(StringIO()):
+            self.db.init_connection()
+            self.db.refresh()
+        self.assertTrue(self.db.is_unchanged())
+
+    def count(self, during_query=None):
+        # Opens the counting connection on first use
+        self.db.count_con = self.db.open_connection()
+        self.db.count_con.during_query = during_query
+        return self.db.count("holiday")
+
+    def write_to_database(self):
+        with open(self.db_filepath, "ab") as f:
+            f.write(b"\0" * 4096)
+
+    def test_own_count(self):
+        self.assertEqual(self.count(), 1)
+        self.assertTrue(self.db.is_unchanged())
+
+    def test_change_during_count(self):
+        self.count(self.write_to_database)
+        self.assertTrue(self.db.is_stale())
+
+    def test_not_stale_while_counting(self):
+        seen = []
+        self.count(lambda: seen.append(self.db.is_stale()))
+        self.assertEqual(seen, [False])
+        self.assertTrue(self.db.is_unchanged())
+
+    def test_overlapping_transactions(self):
+        with self.db.own_transaction():
+            self.count()
+            self.db.fake_con.touch()
+        self.assertTrue(self.db.is_unchanged())
+
+    def test_own_stream(self):
+        rows = [row for batch, _ in self.db.stream("holiday") for row in batch]
+        self.assertEqual(rows, [["holiday.jpg", 1024, 1]])
+        self.assertFalse(self.db.last_query_failed)
+        self.assertTrue(self.db.is_unchanged())
+
+    def test_change_during_stream(self):
+        self.db.fake_con.during_query = self.write_to_database
+        for _ in self.db.stream("holiday"):
+            pass
+        self.assertTrue(self.db.is_stale())
+
+
+if __name__ == "__main__":
+    unittest.main()
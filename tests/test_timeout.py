@@ -0,0 +1,72 @@
+"""Partial results of a database that timed out are marked as such, and not
+replaced by the rows it still finds afterwards."""
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+from io import StringIO
+from time import sleep
+
+from clipfdb.fdb_query import FDBController, count_str
+
+from fakes import FakeFDB, make_config, make_database
+
+
+class SlowFDB(FakeFDB):
+    """Finds a first row right away, the second one after query_timeout."""
+
+    def stream(self, query_str):
+        sleep(0.01)
+        yield [["holiday.jpg", 1024, 1]], 1
+        sleep(0.5)
+        yield [["holiday_2.jpg", 2048, 1]], 2
+
+
+class StubNotifier():
+
+    def __init__(self):
+        self.sent = []
+        self.success_sound = self.failure_sound = None
+
+    def notify(self, message):
+        self.sent.append((count_str(message), message))
+
+    def play(self, sound):
+        pass
+
+
+class TimeoutTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        config = make_config(self.directory.name, notifications="no", terminal_output="yes",
+                             sound_notifications="no", merge_results="no",
+                             search_index="no", bloom_summary="no",
+                             parent_directories="no", accurate_counts="no",
+                             query_timeout="0.2", progress_interval_ms="1")
+        with redirect_stdout(StringIO()):
+            self.controller = FDBController(config=config)
+            db = SlowFDB(make_database(self.directory.name), "", "", config, "test")
+            db.init_connection()
+            db.refresh()
+        db.state = "ready"
+        self.controller.db_handles = [db]
+        self.controller.workers[db] = ThreadPoolExecutor(max_workers=1)
+        self.controller.refreshers[db] = ThreadPoolExecutor(max_workers=1)
+        self.controller.notifier = self.controller.snd_notifier = StubNotifier()
+        self.controller.wants_terminal_output = False
+        self.db = db
+
+    def test_progress_marked_timed_out(self):
+        with redirect_stdout(StringIO()):
+            self.controller.query("holiday")
+            self.controller.workers[self.db].shutdown(wait=True)
+        sent = self.controller.notifier.sent
+        self.assertEqual([count for count, _ in sent], ["1 so far", "1 so far (timed out)"])
+        # The same notification, updated
+        self.assertIs(sent[0][1], sent[1][1])
+
+
+if __name__ == "__main__":
+    unittest.main()
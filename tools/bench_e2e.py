@@ -0,0 +1,228 @@
+#!/usr/bin/python3
+"""Measure the latency of clipfdb lookups from end to end, on synthetic VVV
+databases of 100k, 1M and 10M files.
+
+Clipboard strings, recorded ones or synthetic ones, go through
+filter_content() and FDBController.query() to a stub notifier. Reported for
+each database size: lookups per second, and p50 / p99 of each stage recorded
+by the controller (see `clipster --stats`) and of whole lookups.
+
+Databases are generated once in --directory, which needs a Firebird server
+and the fdb module. Save the results with --save and compare later runs
+against them with --baseline.
+"""
+import argparse
+import json
+import sys
+import tempfile
+from os import path, makedirs, remove
+from time import perf_counter
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+from clipfdb.fdb_query import FDBController, init_config, parse_args  # noqa: E402
+from clipfdb.stats import Histogram  # noqa: E402
+import synthetic  # noqa: E402
+
+SIZES = {"100k": 100_000, "1M": 1_000_000, "10M": 10_000_000}
+
+
+class StubNotifier():
+    """Counts notifications instead of showing them."""
+
+    def __init__(self):
+        self.notified = 0
+
+    def notify(self, message):
+        self.notified += 1
+
+    def simple_notify(self, message, timeout=1000):
+        pass
+
+    def close(self):
+        pass
+
+    def stats(self):
+        return {"notified": self.notified}
+
+
+class StubSoundNotifier():
+    """Counts sounds instead of playing them."""
+    success_sound = "success"
+    failure_sound = "failure"
+    startup_sound = None
+    shutdown_sound = None
+
+    def __init__(self):
+        self.played = 0
+
+    def play(self, snd):
+        if snd:
+            self.played += 1
+
+    def close(self):
+        pass
+
+    def stats(self):
+        return {"played": self.played}
+
+
+def generate(filepath, count, args):
+    if path.exists(filepath) and not args.regenerate:
+        return
+    if path.exists(filepath):
+        remove(filepath)
+    print(f"Generating {filepath} ({count} files)...")
+    start = perf_counter()
+
+    def progress(written):
+        print(f"  {written}/{count}", end="\r", flush=True)
+
+    synthetic.create_database(filepath, count, args.seed, args.user, args.password,
+                              progress=progress)
+    print(f"  done in {perf_counter() - start:.0f} s.")
+
+
+def make_config(args, filepath=None):
+    """clipfdb config, with filepath as its only database if given."""
+    sys.argv = sys.argv[:1] + (["--clipfdb_config", args.clipfdb_config]
+                               if args.clipfdb_config else [])
+    config_args, _ = parse_args()
+    config = init_config(config_args)
+    config.set('clipfdb', 'fast_start', 'no')
+    # Reports are sent to the stubs of make_controller()
+    config.set('clipfdb', 'notifications', 'no')
+    config.set('clipfdb', 'sound_notifications', 'no')
+    config.set('clipfdb', 'terminal_output', 'yes')
+    config.set('clipfdb', 'record_file', '')
+    for option in args.set:
+        key, _, value = option.partition("=")
+        config.set('clipfdb', key.strip(), value.strip())
+    if filepath is not None:
+        for section in config.sections()[1:]:
+            config.remove_section(section)
+        config.set('clipfdb', 'data_dir', path.join(args.directory, "data"))
+        section = path.splitext(path.basename(filepath))[0]
+        config.add_section(section)
+        config.set(section, 'filepath', filepath)
+        config.set(section, 'username', args.user)
+        config.set(section, 'password', args.password)
+    return config
+
+
+def make_controller(config):
+    """FDBController reporting to stubs, once its databases are connected."""
+    controller = FDBController(config=config)
+    controller.wants_terminal_output = False
+    controller.notifier.close()
+    controller.snd_notifier.close()
+    controller.notifier = StubNotifier()
+    controller.snd_notifier = StubSoundNotifier()
+    return controller
+
+
+def bench(filepath, strings, args):
+    """Return {"lookups", "seconds", "throughput", "stages": {stage: summary}}."""
+    controller = make_controller(make_config(args, filepath))
+    try:
+        if any(state != "ready" for state in controller.readiness().values()):
+            raise Exception(f"Could not open {filepath}: {controller.readiness()}")
+        for text in strings[:args.warmup]:
+            controller.query(text)
+        controller.latency.clear()
+        controller.cache.clear()
+
+        lookups = Histogram(len(strings))
+        total = 0.0
+        for text in strings:
+            start = perf_counter()
+            controller.query(text)
+            elapsed = perf_counter() - start
+            lookups.add(elapsed, False)
+            total += elapsed
+        snapshot = controller.latency.snapshot()
+    finally:
+        controller.exit()
+    stages = {}
+    for stages_of_db in snapshot.values():
+        stages.update(stages_of_db)
+    stages["end to end"] = lookups.summary()
+    return {"lookups": len(strings), "seconds": round(total, 3),
+            "throughput": round(len(strings) / total, 1) if total else None,
+            "stages": stages,
+            "notifications": controller.notifier.notified}
+
+
+def delta(value, reference):
+    if value is None or not reference:
+        return ""
+    return f" ({(value - reference) / reference:+.0%})"
+
+
+def report(label, result, baseline=None):
+    baseline = baseline or {}
+    print(f"{label}: {result['lookups']} lookups in {result['seconds']} s, "
+          f"{result['throughput']} lookups/s{delta(result['throughput'], baseline.get('throughput'))}")
+    for stage, summary in result["stages"].items():
+        previous = baseline.get("stages", {}).get(stage, {})
+        print(f"  {stage:<20} {summary['count']:>6}"
+              f"  p50 {summary['p50_ms']:>9.3f} ms{delta(summary['p50_ms'], previous.get('p50_ms')):<8}"
+              f"  p99 {summary['p99_ms']:>9.3f} ms{delta(summary['p99_ms'], previous.get('p99_ms'))}")
+
+
+def load_strings(args, catalog_names):
+    if args.clipboard:
+        with open(args.clipboard, encoding="utf-8") as f:
+            return [line.rstrip("\n") for line in f if line.strip()]
+    return synthetic.clipboard_strings(catalog_names, args.lookups, args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument('--sizes', nargs="+", default=["100k", "1M"], choices=list(SIZES))
+    parser.add_argument('--directory', default=path.join(tempfile.gettempdir(), "clipfdb-bench"),
+                        help="Where synthetic databases are kept")
+    parser.add_argument('--regenerate', action="store_true",
+                        help="Generate databases again even if they exist")
+    parser.add_argument('--user', default="SYSDBA")
+    parser.add_argument('--password', default="masterkey")
+    parser.add_argument('--clipboard', metavar="FILE",
+                        help="Clipboard strings to look up, one per line, "
+                             "instead of synthetic ones")
+    parser.add_argument('--lookups', type=int, default=500,
+                        help="Number of synthetic clipboard strings")
+    parser.add_argument('--warmup', type=int, default=20,
+                        help="Lookups made before measuring")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--clipfdb_config', type=str, default="",
+                        help="Path to clipfdb config directory to take options from")
+    parser.add_argument('--set', action="append", default=[], metavar="OPTION=VALUE",
+                        help="Override a clipfdb option, e.g. search_index=scan")
+    parser.add_argument('--save', metavar="FILE", help="Write results as JSON")
+    parser.add_argument('--baseline', metavar="FILE",
+                        help="Compare with results saved by --save")
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    makedirs(args.directory, exist_ok=True)
+    results = {}
+    for label in args.sizes:
+        count = SIZES[label]
+        filepath = path.join(args.directory, f"synthetic_{label}.fdb")
+        generate(filepath, count, args)
+        # The same names as in the database, to copy some of them
+        catalog_names = list(synthetic.names(min(count, 100_000), args.seed))
+        results[label] = bench(filepath, load_strings(args, catalog_names), args)
+        report(label, results[label], baseline.get(label))
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,213 @@
+#!/usr/bin/python3
+"""Microbenchmarks of the helpers run on every copy, on a fixed corpus of
+clipboard contents and results.
+
+Reported for each helper: median time per call over --repeat runs, how much
+runs differ from it, and peak memory allocated per call. Results are compared
+with the baseline file given, saved by --update-baseline on the same machine.
+The exit status is 1 if a helper got slower, or allocates more, than
+--threshold allows, so that this can run before committing a change. A
+slowdown must also exceed the noise of both measurements, see regressions().
+"""
+import argparse
+import io
+import json
+import sys
+import tracemalloc
+from contextlib import redirect_stdout
+from locale import setlocale, LC_ALL
+from operator import itemgetter
+from os import path, makedirs
+from statistics import median
+from time import perf_counter_ns
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+from clipfdb.fdb_query import (FDB, filter_content, strip_to_basepath,  # noqa: E402
+                               bytes_2_human_readable, locale_keyfunc,
+                               notification_strings, count_str,
+                               init_config, parse_args)
+from clipfdb.ranking import rank  # noqa: E402
+
+# Median absolute deviations of slack given to timings, on top of --threshold
+NOISE = 3
+
+# Clipboard contents as copied from browsers and file managers
+CORPUS = [
+    "https://64.media.tumblr.com/3f2a5b1c9d8e7f6a5b4c3d2e1f0a9b8c/tumblr_p8x2k1ZQ9a1wq3rt7o1_1280.jpg",
+    "https://66.media.tumblr.com/tumblr_oz4mxlS1aB1ufn3pko2_540.gif",
+    "https://78.media.tumblr.com/tumblr_inline_p0ab12CDe31qzt5xv_540.png",
+    "https://someblog.tumblr.com/post/170861234567/some-title-here",
+    "https://t.umblr.com/redirect?z=https%3A%2F%2Fexample.com%2Fgallery%2Fholiday_2019.zip&t=YzQ1",
+    "https://t.umblr.com/redirect?z=http%3A%2F%2Fwww.example.org%2Fvideo%2Fclip%20final.mp4&t=MTIz",
+    "https://pbs.twimg.com/media/EXaMpLe1234AbCd?format=jpg&name=orig",
+    "https://pbs.twimg.com/media/FQ9z_Xy8WcAbC12?format=png&name=large",
+    "https://twitter.com/someone/status/1234567890123456789",
+    "https://mega.nz/file/AbCdEfGh#0123456789abcdefghijklmnopqrstuvwxyzABCD",
+    "https://mega.nz/folder/XyZ12345#abcdefghij",
+    "https://example.com/downloads/Some%20Archive%20Name%20(2020).rar",
+    "https://cdn.example.net/images/2021/07/IMG_20210714_183012.jpg?w=1200",
+    "IMG_20190812_101530.jpg",
+    "DSC01234.JPG",
+    "holiday beach 2019 final.mp4",
+    "wallpaper_3840x2160",
+    "/home/user/Pictures/2018 family/scan_0042.png",
+    "C:\\Users\\someone\\Downloads\\invoice_2020-03.pdf",
+    "ok",
+    "Some copied sentence from a web page, which is not a file name at all.",
+    "first line of a multi-line selection\nsecond line\nthird line",
+]
+# Full paths as returned by SP_GET_FULL_PATH
+PATHS = [
+    "Backup 0/2019 holiday/beach",
+    "Disk 3/photos/2018 family/scans/old",
+    "Archive",
+    "Backup 1/",
+    "/mnt/storage/media/tumblr/2017/07",
+]
+SIZES = [0, 1, 512, 1023, 2048, 5_000_000, 734_003_200, 3_221_225_472, 2 * 1024 ** 4]
+# max_results rows, as found in a database
+RESULTS = [[f"{name}_{i:02d}.jpg", 1024 ** (i % 4) * (i + 1), PATHS[i % len(PATHS)]]
+           for i, name in enumerate(["tumblr_p8x2k1ZQ9a1wq3rt7o1", "IMG_2019", "holiday",
+                                     "Été 2019", "scan", "wallpaper", "DSC0", "ZZ top",
+                                     "apple", "Zebra"] * 2)]
+
+
+def make_db():
+    """FDB handle with the default config, never connected."""
+    with redirect_stdout(io.StringIO()):
+        sys.argv = sys.argv[:1] + ["--clipfdb_config", path.join(path.sep, "nonexistent")]
+        config_args, _ = parse_args()
+        config = init_config(config_args)
+        return FDB(path.join(path.sep, "nonexistent", "bench.fdb"), "", "", config)
+
+
+def benchmarks():
+    """{name: (function, inputs)}, function being called once per input."""
+    db = make_db()
+    queries = [q for q in map(filter_content, CORPUS) if q]
+    query_dict = {'db_filename': "bench.fdb", 'original_query': "holiday",
+                  'count': len(RESULTS), 'exact': False, 'found_words': RESULTS}
+    keyfunc = locale_keyfunc(itemgetter(0))
+    return {
+        "filter_content": (filter_content, CORPUS),
+        "make_select": (db.make_select, queries),
+        "strip_to_basepath": (strip_to_basepath, PATHS),
+        "bytes_2_human_readable": (bytes_2_human_readable, SIZES),
+        "locale_keyfunc sort": (lambda rows: sorted(rows, key=keyfunc), [RESULTS]),
+        "rank": (lambda rows: rank(rows, "holiday", 20), [RESULTS]),
+        "count_str": (count_str, [query_dict]),
+        "notification_strings": (notification_strings, [query_dict]),
+    }
+
+
+def time_per_call(function, inputs, repeat, min_time):
+    """(median, median absolute deviation) of repeat runs, in ns per call.
+    Each run loops over inputs for at least min_time seconds."""
+    loops = 1
+    while True:
+        start = perf_counter_ns()
+        for _ in range(loops):
+            for value in inputs:
+                function(value)
+        elapsed = perf_counter_ns() - start
+        if elapsed >= min_time * 1e9:
+            break
+        loops *= 2
+    runs = [elapsed]
+    for _ in range(repeat - 1):
+        start = perf_counter_ns()
+        for _ in range(loops):
+            for value in inputs:
+                function(value)
+        runs.append(perf_counter_ns() - start)
+    runs = [run / (loops * len(inputs)) for run in runs]
+    middle = median(runs)
+    return middle, median(abs(run - middle) for run in runs)
+
+
+def bytes_per_call(function, inputs):
+    """Mean peak of memory allocated during a call, in bytes."""
+    total = 0
+    tracemalloc.start()
+    for value in inputs:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        function(value)
+        total += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    return total / len(inputs)
+
+
+def regressions(results, baseline, threshold):
+    """[(name, metric, baseline value, new value)] past threshold. Median
+    timings must differ by more than threshold and by more than NOISE times
+    the deviations of both runs: a noisy machine asks for more repeats, not
+    for false alarms."""
+    worse = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+        noise = NOISE * (result.get("ns_mad", 0) + reference.get("ns_mad", 0))
+        for metric, slack in (("ns", noise), ("bytes", 64)):
+            if result[metric] > reference[metric] * (1 + threshold) + slack:
+                worse.append((name, metric, reference[metric], result[metric]))
+    return worse
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument('baseline',
+                        help="Baseline file, timings only compare on the machine that saved it")
+    parser.add_argument('--update-baseline', action="store_true",
+                        help="Save these results as the baseline")
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help="Slowdown or allocation growth tolerated, 0.25 being 25%%")
+    parser.add_argument('--repeat', type=int, default=15,
+                        help="Timed runs per helper, their median is compared")
+    parser.add_argument('--min-time', type=float, default=0.1,
+                        help="Seconds each timed run lasts at least")
+    parser.add_argument('--only', nargs="+", metavar="NAME",
+                        help="Only run these benchmarks")
+    args = parser.parse_args()
+    setlocale(LC_ALL, "")
+
+    baseline = {}
+    if path.exists(args.baseline) and not args.update_baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    results = {}
+    for name, (function, inputs) in benchmarks().items():
+        if args.only and name not in args.only:
+            continue
+        ns, ns_mad = time_per_call(function, inputs, args.repeat, args.min_time)
+        results[name] = {
+            "ns": round(ns, 1),
+            "ns_mad": round(ns_mad, 1),
+            "bytes": round(bytes_per_call(function, inputs)),
+        }
+        line = (f"  {name:<24} {ns:>10.1f} ns/op ±{ns_mad:<8.1f}"
+                f" {results[name]['bytes']:>8} B/op")
+        if name in baseline:
+            line += (f"  ({results[name]['ns'] / baseline[name]['ns'] - 1:+.0%},"
+                     f" {baseline[name]['bytes']} B/op before)")
+        print(line)
+
+    if args.update_baseline:
+        makedirs(path.dirname(args.baseline) or ".", exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved baseline to {args.baseline}.")
+        return 0
+    if not baseline:
+        print(f"No baseline in {args.baseline}, save one with --update-baseline.")
+        return 0
+    worse = regressions(results, baseline, args.threshold)
+    for name, metric, before, after in worse:
+        print(f"Regression: {name} {metric} per call went from {before} to {after}.")
+    return 1 if worse else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
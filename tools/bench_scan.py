@@ -0,0 +1,179 @@
+#!/usr/bin/python3
+"""Compare the in-memory search backends (search_index = scan / trigram)
+with the SQL queries they replace, UPPER(FILE_NAME) LIKE and CONTAINING.
+
+With --generate FILE, a synthetic VVV database of --rows files is created
+there (once, a Firebird server is needed) and queried. With --database, one
+of the databases of your config is. Otherwise, without Firebird, backends
+are only compared with each other and with a row by row scan in Python,
+which checks their results but is no stand-in for the server.
+"""
+import argparse
+import sys
+import tracemalloc
+from os import path
+from time import perf_counter
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+from clipfdb.index import Catalog, TrigramIndex  # noqa: E402
+from clipfdb.scan import ScanIndex  # noqa: E402
+import synthetic  # noqa: E402
+
+
+class RowScan():
+    """Reference results: test every uppercased name in turn."""
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+
+    def search(self, query_str, max_results=0, prefix=False):
+        needle = query_str.upper()
+        rows = []
+        for row_id, upper_name in enumerate(self.catalog.upper_names):
+            if upper_name.startswith(needle) if prefix else needle in upper_name:
+                rows.append(self.catalog.row(row_id))
+                if max_results > 0 and len(rows) >= max_results:
+                    break
+        return rows
+
+
+BACKENDS = {"scan": ScanIndex, "trigram": TrigramIndex, "rowscan": RowScan}
+
+
+def build(backend, catalog):
+    """Return (index, seconds, bytes allocated)."""
+    tracemalloc.start()
+    start = perf_counter()
+    index = backend(catalog)
+    elapsed = perf_counter() - start
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return index, elapsed, size
+
+
+def run_queries(search, queries, max_results):
+    """Return (per query seconds sorted, results)."""
+    timings = []
+    results = []
+    for query_str in queries:
+        start = perf_counter()
+        results.append(search(query_str, max_results))
+        timings.append(perf_counter() - start)
+    timings.sort()
+    return timings, results
+
+
+def percentile(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+
+
+def report(name, timings, build_time=None, size=None):
+    line = (f"  {name:<10} p50 {percentile(timings, .5) * 1000:>9.2f} ms"
+            f"  p99 {percentile(timings, .99) * 1000:>9.2f} ms")
+    if build_time is not None:
+        line += f"  build {build_time:>6.1f} s  {size / 2**20:>7.1f} MiB"
+    print(line)
+
+
+def bench_synthetic(args):
+    print(f"Generating {args.rows} rows...")
+    catalog = Catalog.from_rows(synthetic.rows(args.rows, args.seed))
+    queries = synthetic.sample_queries(catalog.names, args.queries, args.seed)
+    reference = None
+    for name in args.backends:
+        index, build_time, size = build(BACKENDS[name], catalog)
+        timings, results = run_queries(index.search, queries, args.max_results)
+        report(name, timings, build_time, size)
+        if reference is None:
+            reference = results
+        elif results != reference:
+            print(f"  {name} results differ from {args.backends[0]}!")
+            return 1
+        del index
+    return 0
+
+
+def open_database(args):
+    """Connected FDB of the --database section, or of the --generate file."""
+    from clipfdb.fdb_query import FDB, init_config, parse_args
+    sys.argv = sys.argv[:1] + (["--clipfdb_config", args.clipfdb_config]
+                               if args.clipfdb_config else [])
+    config_args, _ = parse_args()
+    config = init_config(config_args)
+    if args.database:
+        section = args.database
+        db = FDB(config.get(section, 'filepath'), config.get(section, 'username'),
+                 config.get(section, 'password'), config)
+    else:
+        if not path.exists(args.generate):
+            print(f"Generating {args.generate} ({args.rows} files)...")
+            synthetic.create_database(args.generate, args.rows, args.seed,
+                                      args.user, args.password)
+        db = FDB(args.generate, args.user, args.password, config)
+    db.init_connection()
+    # FIRST max_results, as FDB queries without relevance ranking
+    db.fetch_limit = args.max_results
+    return db
+
+
+def bench_database(args):
+    db = open_database(args)
+    catalog = Catalog.from_rows(db.fetch_all())
+    db.con.commit()
+    print(f"{db.db_filename}: {len(catalog)} rows")
+    queries = synthetic.sample_queries(catalog.names, args.queries, args.seed)
+
+    def sql(strategy):
+        def search(query_str, max_results):
+            return list(db.execute_select(query_str, strategy))
+        return search
+
+    timings, reference = run_queries(sql("like"), queries, args.max_results)
+    report("sql like", timings)
+    timings, _ = run_queries(sql("containing"), queries, args.max_results)
+    report("containing", timings)
+    db.con.commit()
+    for name in args.backends:
+        if name == "rowscan":
+            continue
+        index, build_time, size = build(BACKENDS[name], catalog)
+        timings, results = run_queries(index.search, queries, args.max_results)
+        report(name, timings, build_time, size)
+        # Rows may come in another order, compare the queries SQL found all
+        # of the matches of
+        for query_str, expected, found in zip(queries, reference, results):
+            if not 0 < args.max_results <= len(expected) \
+            and sorted(map(tuple, expected)) != sorted(map(tuple, found)):
+                print(f"  {name} results for {query_str!r} differ from SQL!")
+                return 1
+        del index
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument('--rows', type=int, default=5_000_000,
+                        help="Size of the synthetic catalog")
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--max-results', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--backends', nargs="+", default=["scan", "trigram", "rowscan"],
+                        choices=list(BACKENDS))
+    parser.add_argument('--clipfdb_config', type=str, default="",
+                        help="Path to clipfdb config directory")
+    parser.add_argument('--database', metavar="SECTION",
+                        help="Benchmark SQL LIKE and CONTAINING against the "
+                             "backends on this configured database")
+    parser.add_argument('--generate', metavar="FILE",
+                        help="Same on a synthetic database of --rows files, "
+                             "created there if it doesn't exist")
+    parser.add_argument('--user', default="SYSDBA")
+    parser.add_argument('--password', default="masterkey")
+    args = parser.parse_args()
+    if args.database or args.generate:
+        return bench_database(args)
+    return bench_synthetic(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
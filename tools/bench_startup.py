@@ -0,0 +1,97 @@
+#!/usr/bin/python3
+"""Measure how long clipfdb takes to start, with and without fast_start.
+
+Each run happens in a fresh interpreter so that imports are not cached.
+Reported for each run:
+    import      importing clipfdb.fdb_query
+    first event FDBController() returning, i.e. when clipster can start
+                monitoring the clipboard
+    ready       every database connected and loaded (or failed)
+    first query latency of a first lookup once ready
+"""
+import argparse
+import json
+import subprocess
+import sys
+from os import path
+
+ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+
+CHILD = """
+import json, sys
+from time import perf_counter, sleep
+start = perf_counter()
+sys.path.insert(0, {root!r})
+from clipfdb.fdb_query import FDBController, init_config, parse_args
+imported = perf_counter()
+args, _ = parse_args()
+config = init_config(args)
+config.set('clipfdb', 'fast_start', {fast_start!r})
+# Reports are sent to stubs below. With terminal output off as well, the
+# controller would disable itself.
+config.set('clipfdb', 'notifications', 'no')
+config.set('clipfdb', 'sound_notifications', 'no')
+config.set('clipfdb', 'terminal_output', 'yes')
+config.set('clipfdb', 'cache_max_entries', '0')
+controller = FDBController(config=config)
+constructed = perf_counter()
+sys.path.insert(0, {tools!r})
+from bench_e2e import StubNotifier, StubSoundNotifier
+controller.wants_terminal_output = False
+controller.notifier.close()
+controller.snd_notifier.close()
+controller.notifier = StubNotifier()
+controller.snd_notifier = StubSoundNotifier()
+while any(state in ("pending", "connecting")
+          for state in controller.readiness().values()):
+    sleep(0.005)
+ready = perf_counter()
+controller.query({query!r})
+queried = perf_counter()
+results = {{
+    "import": imported - start,
+    "first event": constructed - start,
+    "ready": ready - start,
+    "first query": queried - ready,
+    "databases": controller.readiness(),
+}}
+# Prints statistics of its own, our results must come last
+controller.exit()
+print(json.dumps(results))
+"""
+
+
+def run(fast_start, query_str, config_dir):
+    argv = [sys.executable, "-c",
+            CHILD.format(root=ROOT, tools=path.join(ROOT, "tools"),
+                         fast_start=fast_start, query=query_str)]
+    if config_dir:
+        argv += ["--clipfdb_config", config_dir]
+    output = subprocess.run(argv, capture_output=True, text=True, check=True).stdout
+    # The controller prints its own progress before our results
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument('--clipfdb_config', action="store", type=str, default="",
+                        help="Path to clipfdb config directory")
+    parser.add_argument('--runs', action="store", type=int, default=3,
+                        help="Runs for each mode, the best one is reported")
+    parser.add_argument('--query', action="store", type=str, default="tumblr_",
+                        help="Query made once the databases are ready")
+    args = parser.parse_args()
+
+    for fast_start in ("no", "yes"):
+        results = [run(fast_start, args.query, args.clipfdb_config)
+                   for _ in range(args.runs)]
+        best = min(results, key=lambda r: r["first event"])
+        print(f"fast_start = {fast_start}:")
+        for key in ("import", "first event", "ready", "first query"):
+            print(f"  {key:<12} {best[key] * 1000:>9.1f} ms")
+        print(f"  databases    {best['databases']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
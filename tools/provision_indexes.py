@@ -0,0 +1,128 @@
+#!/usr/bin/python3
+"""Create the expression index clipfdb can use on the FILES table of VVV
+databases, and compare query plans and timings before and after.
+
+Stock VVV databases have no index usable for case insensitive lookups, so
+every query is a full table scan. An index on UPPER(FILE_NAME) lets
+Firebird answer the STARTING WITH queries clipfdb makes for tumblr and
+twitter IDs (and the prefix part of other lookups) without reading the whole
+table. LIKE '%...%' and CONTAINING can never use an index.
+
+Databases are only modified with --yes. Use --copy-to to work on copies
+instead, e.g. to measure the difference first.
+"""
+import argparse
+import shutil
+import sys
+from os import environ, path
+from time import perf_counter
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+from clipfdb.fdb_query import (FDB, NAME_INDEX_EXPRESSION, find_name_index,  # noqa: E402
+                               init_config, parse_args)
+
+INDEX_NAME = "IDX_CLIPFDB_UPPER_FILE_NAME"
+# (strategy, query) pairs, see FDB.choose_strategy()
+SAMPLE_QUERIES = [
+    ("starting", "tumblr_"),
+    ("starting", "IMG_2019"),
+    ("starting", "DSC0"),
+    ("like", "holiday"),
+    ("containing", "_1280"),
+]
+
+
+def run_samples(db, samples):
+    """Return [(strategy, query, plan, row count, seconds)] for samples."""
+    results = []
+    cur = db.con.cursor()
+    for strategy, query_str in samples:
+        SELECT, params = db.make_select(query_str, strategy)
+        statement = cur.prep(SELECT)
+        start = perf_counter()
+        rows = cur.execute(statement, params).fetchall()
+        elapsed = perf_counter() - start
+        results.append((strategy, query_str, statement.plan, len(rows), elapsed))
+    db.con.commit()
+    return results
+
+
+def print_samples(title, results):
+    print(f"  {title}:")
+    for strategy, query_str, plan, count, elapsed in results:
+        print(f"    {strategy:<10} {query_str!r:<14} {count:>4} rows "
+              f"{elapsed * 1000:>9.1f} ms  {plan}")
+
+
+def provision(db, create):
+    """Report on one database, creating the index if create is set."""
+    print(f"{db.db_filepath}:")
+    try:
+        db.init_connection()
+    except Exception as e:
+        print(f"  {e}")
+        return False
+
+    existing = find_name_index(db.con)
+    print_samples("before", run_samples(db, SAMPLE_QUERIES))
+    if existing is not None:
+        print(f"  Already indexed by {existing}.")
+        return True
+    if not create:
+        print("  Not modified (use --yes or --copy-to).")
+        return True
+
+    start = perf_counter()
+    db.con.cursor().execute(
+        f"CREATE INDEX {INDEX_NAME} ON FILES COMPUTED BY ({NAME_INDEX_EXPRESSION})")
+    db.con.commit()
+    print(f"  Created {INDEX_NAME} in {perf_counter() - start:.1f} s.")
+    # Plans are cached by the prepared statements, start over
+    db.con.close()
+    db.init_connection()
+    print_samples("after", run_samples(db, SAMPLE_QUERIES))
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument('--clipfdb_config', action="store", type=str, default="",
+                        help="Path to clipfdb config directory")
+    parser.add_argument('--database', action="append", default=[],
+                        help="Config section of a database to process, "
+                             "may be repeated (default: all of them)")
+    parser.add_argument('--sample', action="append", default=[], metavar="STRATEGY:QUERY",
+                        help="Additional sample query, e.g. starting:tumblr_abc")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--yes', action="store_true",
+                       help="Create missing indexes in the configured databases")
+    group.add_argument('--copy-to', action="store", metavar="DIR",
+                       help="Copy databases to DIR and create indexes in the copies")
+    args = parser.parse_args()
+
+    for sample in args.sample:
+        strategy, _, query_str = sample.partition(":")
+        SAMPLE_QUERIES.append((strategy, query_str))
+
+    config_args, _ = parse_args()
+    config = init_config(config_args)
+    environ['FIREBIRD'] = config.get('clipfdb', 'security2_path')
+
+    ok = True
+    for section in config.sections()[1:]:
+        if args.database and section not in args.database:
+            continue
+        filepath = config.get(section, 'filepath')
+        if args.copy_to:
+            copy_path = path.join(args.copy_to, path.basename(filepath))
+            print(f"Copying {filepath} to {copy_path}...")
+            shutil.copy2(filepath, copy_path)
+            filepath = copy_path
+        db = FDB(filepath, config.get(section, 'username'),
+                 config.get(section, 'password'), config)
+        ok = provision(db, create=args.yes or bool(args.copy_to)) and ok
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
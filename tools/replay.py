@@ -0,0 +1,177 @@
+#!/usr/bin/python3
+"""Replay clipboard events recorded with record_file through clipfdb, to
+reproduce the load of a browsing session on the databases of your config.
+
+Events are submitted to FDBController as the daemon does, through debouncing
+and admission, or with --direct passed to FDBController.query() one after
+the other. Notifications and sounds go to stubs. --speed 1 keeps the
+recorded pace, 10 is ten times faster and 0 as fast as possible.
+
+Reported: how many events were looked up, dropped before their lookup
+started or superseded during it, how long they waited and took from being
+copied to being reported (p50 / p99 / max), and the controller's stage
+latencies. Compare runs before and after a change with the same recording.
+"""
+import argparse
+import json
+import sys
+from os import path
+from threading import Lock
+from time import perf_counter, sleep
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+from clipfdb.recorder import read_events  # noqa: E402
+from clipfdb.stats import Histogram, ALL  # noqa: E402
+from bench_e2e import make_config, make_controller, report  # noqa: E402
+
+
+def schedule(events, speed, max_gap):
+    """Yield (seconds after start, text) of events at that speed, idle time
+    between events capped to max_gap seconds of the recording."""
+    offset = 0.0
+    previous = None
+    for event_time, _, text in events:
+        if previous is not None:
+            offset += min(max(0.0, event_time - previous), max_gap)
+        previous = event_time
+        yield (offset / speed if speed > 0 else 0.0), text
+
+
+def replay_submitted(controller, timeline):
+    """Submit events as the daemon does. Return histograms of the wait
+    before each lookup started and of its time to report, and counters."""
+    waits = Histogram(len(timeline))
+    latencies = Histogram(len(timeline))
+    counters = {"superseded": 0}
+    lock = Lock()
+    # Lookup id -> time its content was submitted
+    submitted = {}
+    run_lookup = controller.run_lookup
+
+    def measured(lookup):
+        started = perf_counter()
+        run_lookup(lookup)
+        done = perf_counter()
+        with lock:
+            waits.add(started - submitted[lookup.id], False)
+            if lookup.superseded:
+                counters["superseded"] += 1
+            else:
+                latencies.add(done - submitted[lookup.id], False)
+
+    controller.admission._run = measured
+    late = pace(timeline, lambda text: submit(controller, submitted, text))
+    # Let the last lookups finish
+    deadline = perf_counter() + controller.query_timeout * 2
+    while perf_counter() < deadline:
+        stats = controller.admission.stats()
+        if stats["in_flight"] == 0 and stats["admitted"] + stats["dropped"] >= stats["received"]:
+            break
+        sleep(0.01)
+    counters.update(controller.admission.stats())
+    return waits, latencies, late, counters
+
+
+def submit(controller, submitted, text):
+    # Admission numbers contents in the order they come in, and may start
+    # the lookup before submit() returns
+    submitted[controller.admission.latest + 1] = perf_counter()
+    controller.submit(text)
+
+
+def replay_direct(controller, timeline):
+    """Look up events one after the other, in this thread."""
+    waits = Histogram(len(timeline))
+    latencies = Histogram(len(timeline))
+
+    def query(text):
+        start = perf_counter()
+        controller.query(text)
+        latencies.add(perf_counter() - start, False)
+
+    late = pace(timeline, query)
+    return waits, latencies, late, {"received": len(timeline)}
+
+
+def pace(timeline, feed):
+    """Call feed(text) for each event at its time. Return a histogram of how
+    late events were fed, i.e. the backlog when lookups can't keep up."""
+    late = Histogram(len(timeline))
+    start = perf_counter()
+    for offset, text in timeline:
+        delay = start + offset - perf_counter()
+        if delay > 0:
+            sleep(delay)
+        late.add(max(0.0, -delay), False)
+        feed(text)
+    return late
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument('record_file', help="Events recorded with record_file")
+    parser.add_argument('--speed', type=float, default=1,
+                        help="1 as recorded, 10 ten times faster, 0 as fast as possible")
+    parser.add_argument('--max-gap', type=float, default=30,
+                        help="Longest pause between two events, in recorded seconds")
+    parser.add_argument('--selection', default="CLIPBOARD",
+                        help="Selection to replay, \"all\" for every one. "
+                             "The daemon only looks up CLIPBOARD")
+    parser.add_argument('--direct', action="store_true",
+                        help="Call FDBController.query() in turn instead of "
+                             "submitting like the daemon")
+    parser.add_argument('--clipfdb_config', type=str, default="",
+                        help="Path to clipfdb config directory")
+    parser.add_argument('--set', action="append", default=[], metavar="OPTION=VALUE",
+                        help="Override a clipfdb option, e.g. debounce_ms=0")
+    parser.add_argument('--save', metavar="FILE", help="Write results as JSON")
+    parser.add_argument('--baseline', metavar="FILE",
+                        help="Compare with results saved by --save")
+    args = parser.parse_args()
+
+    selection = None if args.selection == "all" else args.selection
+    timeline = list(schedule(read_events(args.record_file, selection),
+                             args.speed, args.max_gap))
+    if not timeline:
+        print(f"No {args.selection} events in {args.record_file}.")
+        return 1
+    print(f"Replaying {len(timeline)} events over {timeline[-1][0]:.1f} s...")
+
+    controller = make_controller(make_config(args))
+    try:
+        replay = replay_direct if args.direct else replay_submitted
+        start = perf_counter()
+        waits, latencies, late, counters = replay(controller, timeline)
+        elapsed = perf_counter() - start
+        snapshot = controller.latency.snapshot()
+        counters["cache"] = controller.cache.stats()
+    finally:
+        controller.exit()
+
+    stages = {}
+    for db_name, stages_of_db in snapshot.items():
+        for stage, summary in stages_of_db.items():
+            stages[stage if db_name == ALL else f"{db_name} {stage}"] = summary
+    for name, histogram in (("fed late", late), ("waited", waits),
+                            ("copy to report", latencies)):
+        # Everything is due at once as fast as possible
+        if histogram.count and not (histogram is late and args.speed <= 0):
+            stages[name] = histogram.summary()
+    result = {"lookups": latencies.count, "seconds": round(elapsed, 3),
+              "throughput": round(latencies.count / elapsed, 1) if elapsed else None,
+              "stages": stages, "counters": counters}
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    report(path.basename(args.record_file), result, baseline)
+    print(f"  {counters}")
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
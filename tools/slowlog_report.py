@@ -0,0 +1,80 @@
+#!/usr/bin/python3
+"""Summarize the slow query log written with slow_query_ms: the slowest
+queries with their plan, and which databases and query strategies they come
+from.
+"""
+import argparse
+import sys
+from collections import Counter, defaultdict
+from os import path
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+from clipfdb.fdb_query import find_config  # noqa: E402
+from clipfdb.slowlog import read_entries  # noqa: E402
+
+
+def percentile(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+
+
+def print_groups(title, entries, key):
+    groups = defaultdict(list)
+    for entry in entries:
+        groups[key(entry)].append(entry["total_ms"])
+    print(f"{title}:")
+    for name, totals in sorted(groups.items(), key=lambda item: -sum(item[1])):
+        totals.sort()
+        print(f"  {str(name):<32} {len(totals):>5} slow  p50 {percentile(totals, .5):>9.1f} ms"
+              f"  p99 {percentile(totals, .99):>9.1f} ms  max {totals[-1]:>9.1f} ms")
+
+
+def print_worst(entries, count):
+    print(f"Slowest {min(count, len(entries))} queries:")
+    for entry in sorted(entries, key=lambda e: -e["total_ms"])[:count]:
+        stages = ", ".join(f"{stage} {ms} ms" for stage, ms in entry.get("stages_ms", {}).items())
+        flags = [flag for flag in ("superseded", "failed", "error") if entry.get(flag)]
+        print(f"  {entry['total_ms']:>9.1f} ms  {entry['db']}  {entry['query']!r}"
+              f"  ({entry.get('strategy')}, {entry.get('rows')} rows"
+              f"{', ' + ', '.join(flags) if flags else ''})  {entry.get('time', '')}")
+        if stages:
+            print(f"               {stages}")
+        if entry.get("plan"):
+            print(f"               {entry['plan']}")
+
+
+def main():
+    _, data_dir = find_config()
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument('log', nargs="?", default=path.join(data_dir, "slow_queries.log"),
+                        help="Slow query log, rotated ones are read too")
+    parser.add_argument('--worst', type=int, default=15,
+                        help="Number of slowest queries to list")
+    parser.add_argument('--database', help="Only queries on this database file")
+    parser.add_argument('--since', metavar="YYYY-MM-DD[THH:MM]",
+                        help="Only queries logged from then on")
+    args = parser.parse_args()
+
+    entries = [entry for entry in read_entries(args.log)
+               if "total_ms" in entry and "db" in entry and "query" in entry
+               and (args.database is None or entry["db"] == args.database)
+               and (args.since is None or entry.get("time", "") >= args.since)]
+    if not entries:
+        print(f"No slow queries in {args.log}.")
+        return 0
+
+    print(f"{len(entries)} slow queries, from {entries[0].get('time')} "
+          f"to {entries[-1].get('time')}\n")
+    print_groups("By database", entries, lambda e: e["db"])
+    print_groups("By strategy", entries, lambda e: e.get("strategy"))
+    # Same query string looked up several times, e.g. copied again
+    lookups = Counter(e["query"] for e in entries)
+    repeated = [e for e in entries if lookups[e["query"]] > 1]
+    if repeated:
+        print_groups("Repeated queries", repeated, lambda e: e["query"])
+    print()
+    print_worst(entries, args.worst)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,223 @@
+#!/usr/bin/python3
+"""Synthetic VVV-like catalogs, for benchmarks that can't use real databases.
+
+Names follow what clipfdb is mostly queried for: tumblr and twitter media
+names, camera names and plain words with common extensions. create_database()
+writes them to a Firebird database with the tables and procedure of VVV
+catalogs that clipfdb uses.
+"""
+import random
+import string
+from urllib import parse
+
+EXTENSIONS = ["jpg"] * 8 + ["png"] * 3 + ["gif", "mp4", "webm", "mkv", "zip",
+                                         "rar", "pdf", "txt", "json", "webp"]
+WORDS = ["holiday", "beach", "family", "scan", "cover", "wallpaper", "final",
+         "export", "backup", "draft", "render", "screenshot", "invoice",
+         "archive", "photo", "video", "edit", "copy", "new", "old"]
+ALNUM = string.ascii_letters + string.digits
+B36 = string.ascii_lowercase + string.digits
+
+
+def tumblr_name(rng):
+    return (f"tumblr_{''.join(rng.choices(ALNUM, k=19))}"
+            f"_{rng.choice((400, 500, 540, 1280))}.{rng.choice(('jpg', 'png', 'gif'))}")
+
+
+def tumblr_post_name(rng):
+    return f"tumblr_{''.join(rng.choices(B36, k=13))}.{rng.choice(('jpg', 'gif'))}"
+
+
+def twitter_name(rng):
+    return f"{''.join(rng.choices(ALNUM, k=15))}.{rng.choice(('jpg', 'png', 'mp4'))}"
+
+
+def camera_name(rng):
+    prefix = rng.choice(("IMG_", "DSC", "DSC_", "P", "VID_"))
+    return f"{prefix}{rng.randrange(100000):05d}.{rng.choice(('JPG', 'jpg', 'mp4', 'MOV'))}"
+
+
+def plain_name(rng):
+    words = rng.choices(WORDS, k=rng.randint(1, 3))
+    sep = rng.choice(("_", " ", "-", ""))
+    suffix = f"{sep}{rng.randrange(1000)}" if rng.random() < 0.5 else ""
+    return f"{sep.join(words)}{suffix}.{rng.choice(EXTENSIONS)}"
+
+
+# (weight, generator)
+MIX = [
+    (30, tumblr_name),
+    (10, tumblr_post_name),
+    (15, twitter_name),
+    (20, camera_name),
+    (25, plain_name),
+]
+
+
+def names(count, seed=0):
+    """Yield count file names, the same ones for the same seed."""
+    rng = random.Random(seed)
+    generators = [g for w, g in MIX for _ in range(w)]
+    for _ in range(count):
+        yield rng.choice(generators)(rng)
+
+
+def directories(count, seed=0):
+    """Yield (PATH_ID, FATHER_ID, PATH_NAME) rows of a directory tree, PATH_IDs
+    going from 0 to count - 1. Top level directories have FATHER_ID -1."""
+    rng = random.Random(seed + 3)
+    roots = max(1, count // 1000)
+    for path_id in range(count):
+        if path_id < roots:
+            yield path_id, -1, f"{rng.choice(('Backup', 'Disk', 'Archive'))} {path_id}"
+            continue
+        # Parents among the latest directories make deeper trees
+        father_id = rng.randrange(max(0, path_id - 50), path_id)
+        name = rng.choice(WORDS)
+        if rng.random() < 0.4:
+            name = f"{rng.randrange(2005, 2025)} {name}"
+        yield path_id, father_id, name
+
+
+def rows(count, seed=0, directories=1000):
+    """Yield (FILE_NAME, FILE_SIZE, PATH_ID) rows, like FDB.fetch_all()."""
+    rng = random.Random(seed + 1)
+    for name in names(count, seed):
+        yield name, rng.randrange(1, 50 * 1024 * 1024), rng.randrange(directories)
+
+
+def query_for(name):
+    """What filter_content() extracts from a link to name."""
+    stem = name.rsplit(".", 1)[0]
+    if stem.startswith("tumblr_"):
+        # Size suffixes are stripped
+        stem = stem.rsplit("_", 1)[0] if stem.count("_") > 1 else stem
+    return stem
+
+
+def sample_queries(catalog_names, count, seed=0):
+    """Half queries for names of the catalog, half for names not in it."""
+    rng = random.Random(seed + 2)
+    queries = [query_for(catalog_names[rng.randrange(len(catalog_names))])
+               for _ in range(count // 2)]
+    while len(queries) < count:
+        queries.append(query_for(rng.choice((tumblr_name, twitter_name))(rng)))
+    rng.shuffle(queries)
+    return queries
+
+
+def clipboard_string(name, rng):
+    """Something a user could copy to look name up: a link, a path or the
+    name itself."""
+    stem, _, ext = name.rpartition(".")
+    if stem.startswith("tumblr_"):
+        return (f"https://64.media.tumblr.com/{''.join(rng.choices('0123456789abcdef', k=32))}"
+                f"/{name}")
+    if len(stem) == 15 and "_" not in stem and ext in ("jpg", "png"):
+        return f"https://pbs.twimg.com/media/{stem}?format={ext}&name=orig"
+    kind = rng.random()
+    if kind < 0.3:
+        return f"/home/user/{rng.choice(WORDS)}/{name}"
+    if kind < 0.5:
+        return f"https://example.com/files/{parse.quote(name)}"
+    return name
+
+
+# Copied text filter_content() rejects
+NOISE = ["ok", "https://mega.nz/file/abcdefgh#0123456789", "see you\ntomorrow",
+         "abc", "https://example.com/"]
+
+
+def clipboard_strings(catalog_names, count, seed=0, noise=0.1):
+    """Clipboard contents, as recorded by clipster: links to or names of
+    files of the catalog, of files not in it, and a share of noise."""
+    rng = random.Random(seed + 4)
+    strings = []
+    for _ in range(count):
+        kind = rng.random()
+        if kind < noise:
+            strings.append(rng.choice(NOISE))
+        elif kind < (1 + noise) / 2:
+            strings.append(clipboard_string(
+                catalog_names[rng.randrange(len(catalog_names))], rng))
+        else:
+            generator = rng.choice([g for w, g in MIX for _ in range(w)])
+            strings.append(clipboard_string(generator(rng), rng))
+    return strings
+
+
+# Subset of the schema of VVV catalogs clipfdb relies on. Stock databases
+# have no index on file names.
+SCHEMA = [
+    """CREATE TABLE PATHS (
+        PATH_ID INTEGER NOT NULL PRIMARY KEY,
+        FATHER_ID INTEGER,
+        PATH_NAME VARCHAR(512))""",
+    """CREATE TABLE FILES (
+        FILE_ID INTEGER NOT NULL PRIMARY KEY,
+        FILE_NAME VARCHAR(512),
+        FILE_EXT VARCHAR(32),
+        FILE_SIZE BIGINT,
+        FILE_DATETIME TIMESTAMP,
+        PATH_FILE_ID INTEGER,
+        PATH_ID INTEGER,
+        FILE_DESCRIPTION VARCHAR(1024))""",
+    """CREATE PROCEDURE SP_GET_FULL_PATH (START_ID INTEGER, SEP VARCHAR(8))
+    RETURNS (FULL_PATH VARCHAR(8191))
+    AS
+    DECLARE VARIABLE CURRENT_ID INTEGER;
+    DECLARE VARIABLE PARENT_ID INTEGER;
+    DECLARE VARIABLE NAME VARCHAR(512);
+    BEGIN
+        FULL_PATH = '';
+        CURRENT_ID = START_ID;
+        WHILE (CURRENT_ID >= 0) DO
+        BEGIN
+            SELECT P.FATHER_ID, P.PATH_NAME FROM PATHS P
+            WHERE P.PATH_ID = :CURRENT_ID INTO :PARENT_ID, :NAME;
+            IF (ROW_COUNT = 0) THEN LEAVE;
+            IF (FULL_PATH = '') THEN FULL_PATH = NAME;
+            ELSE FULL_PATH = NAME || SEP || FULL_PATH;
+            CURRENT_ID = COALESCE(PARENT_ID, -1);
+        END
+    END""",
+]
+
+
+def create_database(filepath, count, seed=0, user="SYSDBA", password="masterkey",
+                    batch=10000, progress=None):
+    """Write a VVV-like database of count files to filepath, which must not
+    exist. Needs a Firebird server. progress(rows written) is called now and
+    then."""
+    import fdb
+    con = fdb.create_database(
+        f"CREATE DATABASE '{filepath}' USER '{user}' PASSWORD '{password}' "
+        "PAGE_SIZE 16384 DEFAULT CHARACTER SET UTF8")
+    try:
+        for statement in SCHEMA:
+            con.execute_immediate(statement)
+        con.commit()
+        cur = con.cursor()
+        directory_count = max(1000, count // 100)
+        cur.executemany("INSERT INTO PATHS (PATH_ID, FATHER_ID, PATH_NAME) VALUES (?, ?, ?)",
+                        list(directories(directory_count, seed)))
+        con.commit()
+        insert = ("INSERT INTO FILES (FILE_ID, FILE_NAME, FILE_EXT, FILE_SIZE, PATH_ID) "
+                  "VALUES (?, ?, ?, ?, ?)")
+        pending = []
+        for file_id, (name, size, path_id) in enumerate(
+                rows(count, seed, directory_count)):
+            pending.append((file_id, name, name.rpartition(".")[2], size, path_id))
+            if len(pending) >= batch:
+                cur.executemany(insert, pending)
+                con.commit()
+                pending = []
+                if progress is not None:
+                    progress(file_id + 1)
+        if pending:
+            cur.executemany(insert, pending)
+            con.commit()
+        if progress is not None:
+            progress(count)
+    finally:
+        con.close()